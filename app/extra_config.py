@@ -12,6 +12,12 @@ CUSTOM_PACK_NAME = getenv("CUSTOM_PACK_NAME")
 
 DISABLED_SUPERUSERS: list[int] = []
 
+DOWNLOAD_CONNECTIONS: int = int(getenv("DOWNLOAD_CONNECTIONS", 4))
+
+DOWNLOAD_QUOTA_MB: int = int(getenv("DOWNLOAD_QUOTA_MB", 0))
+
+DOWNLOAD_WORKERS: int = int(getenv("DOWNLOAD_WORKERS", 3))
+
 FBAN_LOG_CHANNEL: int = int(getenv("FBAN_LOG_CHANNEL") or getenv("LOG_CHAT"))
 
 FBAN_SUDO_ID: int = int(getenv("FBAN_SUDO_ID", 0))
@@ -34,6 +40,10 @@ TAG_LOGGER: bool = False
 
 TAG_LOGGER_THREAD_ID: int = int(getenv("TAG_LOGGER_THREAD_ID", 0)) or None
 
+TG_DOWNLOAD_WORKERS: int = int(getenv("TG_DOWNLOAD_WORKERS", 4))
+
+UPLOAD_WORKERS: int = int(getenv("UPLOAD_WORKERS", 3))
+
 UPSTREAM_REPO: str = getenv("UPSTREAM_REPO", "https://github.com/thedragonsinn/plain-ub")
 
 USE_LEGACY_KANG: int = int(getenv("USE_LEGACY_KANG", 0))
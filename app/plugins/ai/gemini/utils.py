@@ -1,6 +1,4 @@
 import asyncio
-import shutil
-import time
 from functools import wraps
 from mimetypes import guess_type
 
@@ -9,6 +7,7 @@ from ub_core.utils import get_tg_media_details
 
 from app import BOT, Message, extra_config
 from app.plugins.ai.gemini import DB_SETTINGS, AIConfig, async_client
+from app.plugins.files.scratch import scratch
 
 
 def run_basic_check(function):
@@ -36,9 +35,9 @@ async def save_file(message: Message, check_size: bool = True) -> File | None:
     if check_size:
         assert getattr(media, "file_size", 0) <= 1048576 * 25, "File size exceeds 25mb."
 
-    download_dir = f"downloads/{time.time()}/"
-    try:
-        downloaded_file: str = await message.download(download_dir)
+    async with scratch.job() as job:
+        await job.reserve(getattr(media, "file_size", 0))
+        downloaded_file: str = await message.download(f"{job.path}/")
         uploaded_file = await async_client.files.upload(
             file=downloaded_file,
             config={
@@ -51,9 +50,6 @@ async def save_file(message: Message, check_size: bool = True) -> File | None:
 
         return uploaded_file
 
-    finally:
-        shutil.rmtree(download_dir, ignore_errors=True)
-
 
 PROMPT_MAP = {
     "video": "Summarize video and audio from the file",
@@ -1,11 +1,66 @@
 import asyncio
+import os
 import time
+from collections import deque
 from pathlib import Path
+from typing import Awaitable, Callable
+from urllib.parse import unquote, urlparse
 
+import aiohttp
+from pyrogram.enums import MessageMediaType
 from ub_core.utils import (Download, DownloadedFile, get_filename_from_mime,
                            get_tg_media_details, progress)
+from ub_core.utils.helpers import create_chunks
 
-from app import BOT, Message, bot
+from app import BOT, Config, CustomDB, Message, bot, extra_config
+from app.plugins.files.journal import journal
+from app.plugins.files.scratch import scratch
+from app.plugins.files.tg_parallel import parallel_download
+from app.plugins.tg_tools.get_message import parse_link
+
+# file_unique_id -> path of media fetched by bulk downloads, to skip it on re-runs.
+DOWNLOADED_MEDIA = CustomDB["DOWNLOADED_MEDIA"]
+
+DOWNLOADABLE_MEDIA = {
+    MessageMediaType.ANIMATION,
+    MessageMediaType.AUDIO,
+    MessageMediaType.DOCUMENT,
+    MessageMediaType.PHOTO,
+    MessageMediaType.VIDEO,
+    MessageMediaType.VIDEO_NOTE,
+    MessageMediaType.VOICE,
+}
+
+# Most ids get_messages accepts in one call.
+GET_MESSAGES_LIMIT = 200
+
+# Extra headers, or a coroutine function returning them for auth that expires mid download.
+HEADERS = dict | Callable[[], Awaitable[dict]] | None
+
+# Smaller files aren't worth more than one connection.
+MIN_SEGMENTED_SIZE = 8388608
+# Telegram media below this is fetched with a plain message.download.
+MIN_PARALLEL_TG_SIZE = 10485760
+# A connection that runs out of work only takes over halves of segments bigger than this.
+MIN_STEAL_SIZE = 4194304
+READ_SIZE = 262144
+
+_session: aiohttp.ClientSession | None = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Pooled session shared by segmented downloads, closed on exit."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(sock_read=60))
+        Config.EXIT_TASKS.append(_session.close)
+    return _session
+
+
+async def resolve_headers(headers: HEADERS) -> dict:
+    if callable(headers):
+        return await headers()
+    return headers or {}
 
 
 @bot.add_cmd(cmd="download")
@@ -13,10 +68,15 @@ async def down_load(bot: BOT, message: Message):
     """
     CMD: DOWNLOAD
     INFO: Download Files/TG Media to Bot server.
-    FLAGS: "-f" for custom filename
+    FLAGS:
+        -f: custom filename
+        -range: all media between two message links, albums in folders of their own
+        -album: every file of the album a link or replied message belongs to
     USAGE:
         .download URL | Reply to Media
         .download -f file.ext URL | Reply to Media
+        .download -range t.me/c/123/100 t.me/c/123/400
+        .download -album t.me/c/123/100 | Reply to Media
     """
     response = await message.reply("Checking Input...")
 
@@ -26,18 +86,24 @@ async def down_load(bot: BOT, message: Message):
         )
         return
 
-    dl_dir_name = Path("downloads") / str(time.time())
+    dl_dir_name = scratch.new_dir()
 
     await response.edit("Input verified....Starting Download...")
 
+    if "-range" in message.flags or "-album" in message.flags:
+        await bulk_telegram_download(message=message, response=response, dir_name=dl_dir_name)
+        return
+
     file_name = None
     dl_obj: None = None
+    partial: dict | None = None
 
     if message.replied and message.replied.media:
 
         if "-f" in message.flags:
             file_name = message.filtered_input
 
+        size = get_tg_media_details(message.replied).file_size
         download_coro = telegram_download(
             message=message.replied,
             response=response,
@@ -53,12 +119,25 @@ async def down_load(bot: BOT, message: Message):
             url = message.filtered_input
 
         if url.startswith("https://t.me/"):
+            tg_message = await bot.get_messages(link=url)
+            size = get_tg_media_details(tg_message).file_size
             download_coro = telegram_download(
-                message=await bot.get_messages(link=url),
+                message=tg_message,
                 response=response,
                 dir_name=dl_dir_name,
                 file_name=file_name,
             )
+
+        elif (url_info := await probe_url(url, session=get_session())).is_segmentable:
+            size = url_info.size
+            partial = await find_partial(url=url, url_info=url_info)
+            download_coro = resumable_download(
+                url=url,
+                url_info=url_info,
+                file_path=dl_dir_name / (file_name or url_info.file_name),
+                response=response,
+            )
+
         else:
             dl_obj: Download = await Download.setup(
                 url=url,
@@ -66,10 +145,15 @@ async def down_load(bot: BOT, message: Message):
                 message_to_edit=response,
                 custom_file_name=file_name,
             )
+            size = int(dl_obj.size * 1048576)
             download_coro = dl_obj.download()
 
     try:
-        downloaded_file: DownloadedFile = await download_coro
+        async with scratch.job(dl_dir_name, keep=True) as job:
+            if partial:
+                size -= await job.claim(partial["path"])
+            await job.reserve(size, response)
+            downloaded_file: DownloadedFile = await download_coro
         await response.edit(
             f"<code>{downloaded_file.path}</code>"
             f"\n\n<code>{downloaded_file.size}</code> mb"
@@ -87,16 +171,219 @@ async def down_load(bot: BOT, message: Message):
         await response.edit(str(e))
 
     finally:
+        # Never awaited if the space couldn't be reserved.
+        download_coro.close()
         if dl_obj:
             await dl_obj.close()
 
 
+@bot.add_cmd(cmd="dlresume")
+async def download_resume(bot: BOT, message: Message):
+    """
+    CMD: DLRESUME
+    INFO: List url downloads that stopped midway, or resume one.
+    USAGE:
+        .dlresume
+        .dlresume <id>
+    """
+    if not message.filtered_input:
+        entries = await journal.entries()
+        if not entries:
+            await message.reply("No incomplete downloads.")
+            return
+
+        lines = []
+        for entry in sorted(entries, key=lambda entry: entry["updated"]):
+            missing = sum(end - start + 1 for start, end in entry["segments"])
+            done = 100 * (1 - missing / (entry["size"] or 1))
+            lines.append(
+                f"<code>{entry["_id"]}</code> | {os.path.basename(entry["path"])}"
+                f"\n{done:.1f}% of {entry["size"] / 1048576:.1f} mb"
+            )
+        await message.reply("\n\n".join(lines) + "\n\nResume with .dlresume <id>")
+        return
+
+    response = await message.reply("Checking Input...")
+
+    if not (entry := await journal.get(message.filtered_input)):
+        await response.edit("No incomplete download with that id.")
+        return
+
+    url_info = await probe_url(entry["url"], session=get_session())
+    if url_info.validator != entry["validator"] or url_info.size != entry["size"]:
+        await journal.remove(entry["_id"])
+        await response.edit("File changed on the server, start over with .download")
+        return
+
+    try:
+        async with scratch.job(keep=True) as job:
+            await job.reserve(url_info.size - await job.claim(entry["path"]), response)
+            downloaded_file = await resumable_download(
+                url=entry["url"],
+                url_info=url_info,
+                file_path=Path(entry["path"]),
+                response=response,
+            )
+        await response.edit(
+            f"<code>{downloaded_file.path}</code>"
+            f"\n\n<code>{downloaded_file.size}</code> mb"
+            "\n\n<b>Downloaded.</b>"
+        )
+
+    except asyncio.exceptions.CancelledError:
+        await response.edit("Cancelled....")
+
+    except Exception as e:
+        await response.edit(str(e))
+
+
+async def iter_range_messages(client: BOT, start_link: str, end_link: str):
+    chat_id, _, start = parse_link(start_link)
+    end_chat_id, _, end = parse_link(end_link)
+
+    if chat_id != end_chat_id:
+        raise ValueError("Both links must be from the same chat.")
+
+    message_ids = list(range(min(start, end), max(start, end) + 1))
+
+    for chunk in create_chunks(message_ids, chunk_size=GET_MESSAGES_LIMIT):
+        for message in await client.get_messages(chat_id=chat_id, message_ids=chunk, replies=0):
+            yield message
+
+
+async def iter_album_messages(client: BOT, message: Message):
+    if message.replied and message.replied.media:
+        chat_id, message_id = message.replied.chat.id, message.replied.id
+    else:
+        chat_id, _, message_id = parse_link(message.filtered_input)
+
+    try:
+        album = await client.get_media_group(chat_id=chat_id, message_id=message_id)
+    except ValueError:
+        # Not part of an album, just the one message.
+        album = [await client.get_messages(chat_id=chat_id, message_ids=message_id)]
+
+    for album_message in album:
+        yield album_message
+
+
+async def bulk_telegram_download(message: Message, response: Message, dir_name: Path):
+    """
+    Download the media of many messages with DOWNLOAD_WORKERS running at once.
+    Albums go in a folder named after their media group, files downloaded
+    by an earlier run (same file_unique_id, file still on disk) are skipped.
+    """
+    client = message._client
+
+    if "-range" in message.flags:
+        links = message.filtered_input.split()
+        if len(links) != 2:
+            await response.edit("Give a start and an end message link.")
+            return
+        source = iter_range_messages(client, *links)
+    else:
+        source = iter_album_messages(client, message)
+
+    workers = max(extra_config.DOWNLOAD_WORKERS, 1)
+    queue: asyncio.Queue[Message | None] = asyncio.Queue(maxsize=workers * 2)
+    counts = {"found": 0, "done": 0, "skipped": 0}
+    failed: list[str] = []
+
+    async def producer():
+        async for media_message in source:
+            if media_message.media in DOWNLOADABLE_MEDIA:
+                counts["found"] += 1
+                await queue.put(media_message)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def worker():
+        while (media_message := await queue.get()) is not None:
+            tg_media = get_tg_media_details(media_message)
+
+            record = await DOWNLOADED_MEDIA.find_one({"_id": tg_media.file_unique_id})
+            if record and os.path.isfile(record["path"]):
+                counts["skipped"] += 1
+                continue
+
+            target_dir = dir_name
+            if media_message.media_group_id:
+                target_dir = dir_name / str(media_message.media_group_id)
+
+            file_name = tg_media.file_name or get_filename_from_mime(tg_media.mime_type)
+
+            try:
+                await job.reserve(tg_media.file_size)
+                downloaded_file = await telegram_download(
+                    message=media_message,
+                    response=None,
+                    dir_name=target_dir,
+                    # Prefixed with the id, channels are full of files named video.mp4
+                    file_name=f"{media_message.id}_{file_name}",
+                )
+            except Exception as e:
+                failed.append(f"{media_message.link}: {e}")
+                continue
+
+            await DOWNLOADED_MEDIA.add_data(
+                {
+                    "_id": tg_media.file_unique_id,
+                    "path": str(downloaded_file.path),
+                    "chat_id": media_message.chat.id,
+                    "message_id": media_message.id,
+                }
+            )
+            counts["done"] += 1
+
+    async def progress_worker():
+        last_text = ""
+        while True:
+            await asyncio.sleep(5)
+            text = (
+                f"Downloading {counts["done"]}/{counts["found"]} files..."
+                f"\nAlready downloaded: {counts["skipped"]} | Failed: {len(failed)}"
+            )
+            # Telegram rejects edits that change nothing with MessageNotModified.
+            if text != last_text:
+                await response.edit(text)
+                last_text = text
+
+    async with scratch.job(dir_name, keep=True) as job:
+        tasks = [asyncio.create_task(worker(), name="bulk_dl_worker") for _ in range(workers)]
+        progress_task = asyncio.create_task(progress_worker(), name="bulk_dl_prog")
+
+        try:
+            await asyncio.gather(producer(), *tasks)
+
+        except asyncio.exceptions.CancelledError:
+            await response.edit("Cancelled....")
+            raise
+
+        except Exception as e:
+            await response.edit(str(e))
+            return
+
+        finally:
+            for task in (*tasks, progress_task):
+                task.cancel()
+
+    text = (
+        f"<code>{dir_name}</code>"
+        f"\n\nDownloaded: {counts["done"]} | Already downloaded: {counts["skipped"]}"
+        f" | Failed: {len(failed)}"
+    )
+    if failed:
+        text += "\n\n" + "\n".join(failed[:5])
+
+    await response.edit(text, disable_preview=True)
+
+
 async def telegram_download(
     message: Message, response: Message, dir_name: Path, file_name: str | None = None
 ) -> DownloadedFile:
     """
     :param message: Message Containing Media
-    :param response: Response to Edit
+    :param response: Response to Edit, None for no progress
     :param dir_name: Download path
     :param file_name: Custom File Name
     :return: DownloadedFile
@@ -107,11 +394,350 @@ async def telegram_download(
 
     media_obj: DownloadedFile = DownloadedFile(file=dir_name / file_name, size=tg_media.file_size)
 
+    if tg_media.file_size >= MIN_PARALLEL_TG_SIZE and extra_config.TG_DOWNLOAD_WORKERS > 1:
+        try:
+            await parallel_download(
+                client=message._client,
+                file_id=tg_media.file_id,
+                file_path=dir_name / file_name,
+                size=tg_media.file_size,
+                workers=extra_config.TG_DOWNLOAD_WORKERS,
+                response=response,
+            )
+            return media_obj
+        except Exception as e:
+            # CDN files, expired references and session errors all still work the slow way.
+            bot.log.error(f"Parallel download failed, falling back: {e}")
+
     progress_args = (response, "Downloading...", media_obj.path)
 
     await message.download(
         file_name=media_obj.path,
-        progress=progress,
+        progress=progress if response else None,
         progress_args=progress_args,
     )
     return media_obj
+
+
+class UrlInfo:
+    def __init__(
+        self,
+        size: int | None,
+        file_name: str | None,
+        accepts_ranges: bool,
+        validator: str | None = None,
+    ):
+        self.size = size
+        self.file_name = file_name
+        self.accepts_ranges = accepts_ranges
+        # ETag or Last-Modified, only downloads with one can be resumed safely.
+        self.validator = validator
+
+    @property
+    def is_segmentable(self) -> bool:
+        return bool(
+            self.accepts_ranges and self.file_name and (self.size or 0) >= MIN_SEGMENTED_SIZE
+        )
+
+
+async def probe_url(url: str, session: aiohttp.ClientSession, headers: HEADERS = None) -> UrlInfo:
+    """Ask for the first byte, a 206 or Accept-Ranges means the url can be split."""
+    request_headers = {**await resolve_headers(headers), "Range": "bytes=0-0"}
+
+    try:
+        async with session.get(url, headers=request_headers) as resp:
+            if resp.status == 206:
+                # Content-Range: bytes 0-0/<total>, total is * when unknown.
+                total = resp.headers.get("Content-Range", "").rpartition("/")[2]
+                size = int(total) if total.isdigit() else None
+                accepts_ranges = True
+            else:
+                size = resp.content_length if resp.status == 200 else None
+                accepts_ranges = resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+            disposition = resp.content_disposition
+            file_name = (disposition and disposition.filename) or unquote(
+                os.path.basename(urlparse(str(resp.url)).path)
+            )
+            validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return UrlInfo(size=None, file_name=None, accepts_ranges=False)
+
+    return UrlInfo(
+        size=size,
+        file_name=os.path.basename(file_name) or None,
+        accepts_ranges=accepts_ranges,
+        validator=validator,
+    )
+
+
+async def find_partial(url: str, url_info: UrlInfo) -> dict | None:
+    """Journal entry of an earlier partial download of url that can be resumed."""
+    if not url_info.validator:
+        return None
+    return await journal.find_partial(journal.key(url, url_info.validator), size=url_info.size)
+
+
+async def resumable_download(
+    url: str, url_info: UrlInfo, file_path: Path, response: Message | None = None
+) -> DownloadedFile:
+    """
+    ranged_download that is journaled, so a timeout or restart can pick up where it stopped.
+    An earlier partial of the same url and ETag/Last-Modified is reused instead of file_path.
+    """
+    if not url_info.validator:
+        return await ranged_download(
+            url=url,
+            file_path=file_path,
+            size=url_info.size,
+            session=get_session(),
+            connections=extra_config.DOWNLOAD_CONNECTIONS,
+            response=response,
+        )
+
+    key = journal.key(url, url_info.validator)
+    resume = None
+
+    # Callers claim the partial's dir from the scratch space before this runs.
+    if entry := await find_partial(url=url, url_info=url_info):
+        file_path = Path(entry["path"])
+        resume = entry["segments"]
+        if response:
+            await response.edit(f"Resuming <code>{file_path.name}</code>...")
+
+    async def checkpoint(segments: list[list[int]]):
+        await journal.save(
+            key,
+            url=url,
+            validator=url_info.validator,
+            path=str(file_path),
+            size=url_info.size,
+            segments=segments,
+        )
+
+    downloaded_file = await ranged_download(
+        url=url,
+        file_path=file_path,
+        size=url_info.size,
+        session=get_session(),
+        connections=extra_config.DOWNLOAD_CONNECTIONS,
+        response=response,
+        resume=resume,
+        checkpoint=checkpoint,
+    )
+    await journal.remove(key)
+    return downloaded_file
+
+
+class Segment:
+    """Byte range still owed by one connection, end is inclusive and can shrink."""
+
+    def __init__(self, start: int, end: int):
+        self.position = start
+        self.end = end
+
+    @property
+    def remaining(self) -> int:
+        return self.end - self.position + 1
+
+
+async def ranged_download(
+    url: str,
+    file_path: Path,
+    size: int,
+    session: aiohttp.ClientSession,
+    headers: HEADERS = None,
+    connections: int = 4,
+    response: Message | None = None,
+    retries: int = 3,
+    resume: list[list[int]] | None = None,
+    checkpoint: Callable[[list[list[int]]], Awaitable] | None = None,
+) -> DownloadedFile:
+    """
+    :param url: Url of a server that honours Range requests
+    :param file_path: Download path
+    :param size: Total size in bytes
+    :param session: Session to make the requests on
+    :param headers: Extra headers for every request, or a coroutine function returning them
+    :param connections: Number of parallel Range requests
+    :param response: Response to Edit
+    :param retries: Consecutive failures allowed per connection before giving up
+    :param resume: [start, end] ranges still missing from an existing partial file_path
+    :param checkpoint: Called with the missing ranges every progress tick and on failure
+    :return: DownloadedFile
+
+    Splits the file in equal segments and writes each straight to its offset
+    in a preallocated sparse file, so segments can finish in any order.
+    A connection that finishes early takes over the second half of the biggest
+    unfinished segment, so one slow connection doesn't hold up the whole file.
+    """
+    if resume:
+        segments = [Segment(start, end) for start, end in resume]
+    else:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(file_path, "wb") as file:
+            file.truncate(size)
+
+        part_size = -(-size // max(connections, 1)) if size else 1
+        segments = [
+            Segment(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)
+        ]
+
+    downloaded = size - sum(segment.remaining for segment in segments)
+    resumed_from = downloaded
+    started = time.time()
+
+    def missing() -> list[list[int]]:
+        return [[segment.position, segment.end] for segment in segments if segment.remaining]
+
+    def steal() -> Segment | None:
+        busiest = max(segments, key=lambda segment: segment.remaining, default=None)
+        if busiest is None or busiest.remaining < MIN_STEAL_SIZE:
+            return None
+        middle = busiest.position + busiest.remaining // 2
+        stolen = Segment(middle, busiest.end)
+        # The owner's request is still open up to the old end, it stops at the new one.
+        busiest.end = middle - 1
+        segments.append(stolen)
+        return stolen
+
+    async def fetch(segment: Segment):
+        nonlocal downloaded
+        segment_headers = {
+            **await resolve_headers(headers),
+            "Range": f"bytes={segment.position}-{segment.end}",
+        }
+        async with session.get(url, headers=segment_headers) as resp:
+            if resp.status != 206:
+                raise Exception(f"Range request failed with {resp.status}: {await resp.text()}")
+
+            async for chunk in resp.content.iter_chunked(READ_SIZE):
+                if len(chunk) > segment.remaining:
+                    chunk = memoryview(chunk)[: segment.remaining]
+                os.pwrite(fd, chunk, segment.position)
+                segment.position += len(chunk)
+                downloaded += len(chunk)
+                if not segment.remaining:
+                    break
+
+    async def worker(segment: Segment | None):
+        # Connections beyond the resumed ranges start by splitting one.
+        segment = segment or steal()
+        failures = 0
+        while segment:
+            while segment.remaining:
+                position = segment.position
+                try:
+                    await fetch(segment)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+                # Errors and connections closed early retry from where they stopped.
+                if segment.position == position:
+                    failures += 1
+                    if failures > retries:
+                        raise Exception(f"Range {segment.position}-{segment.end} kept failing.")
+                    await asyncio.sleep(failures)
+                else:
+                    failures = 0
+            segments.remove(segment)
+            segment = steal()
+
+    async def progress_worker():
+        while True:
+            rate = (downloaded - resumed_from) / max(time.time() - started, 1) / 1048576
+            if checkpoint:
+                await checkpoint(missing())
+            if response:
+                await progress(
+                    current_size=downloaded,
+                    total_size=size or 1,
+                    response=response,
+                    action_str=f"Downloading... [{len(segments)} conn @ {rate:.1f} mb/s]",
+                    file_path=file_path,
+                )
+            await asyncio.sleep(5)
+
+    fd = os.open(file_path, os.O_WRONLY)
+    initial = segments + [None] * max(connections - len(segments), 0) if segments else []
+    workers = [
+        asyncio.create_task(worker(segment), name="ranged_dl_worker") for segment in initial
+    ]
+    progress_task = asyncio.create_task(progress_worker(), name="ranged_dl_prog")
+
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for task in (*workers, progress_task):
+            task.cancel()
+        os.close(fd)
+        if checkpoint and segments:
+            await checkpoint(missing())
+
+    # The file is preallocated, so count what was written as well as its length.
+    if downloaded != size or os.path.getsize(file_path) != size:
+        raise Exception(f"Size mismatch: got {downloaded} of {size} bytes.")
+
+    return DownloadedFile(file=file_path, size=size)
+
+
+async def iter_ranges(
+    url: str,
+    size: int,
+    session: aiohttp.ClientSession,
+    headers: HEADERS = None,
+    connections: int = 4,
+    block_size: int = 8388608,
+    retries: int = 3,
+):
+    """
+    Yield the bytes of url in order, in blocks of block_size,
+    while keeping up to `connections` Range requests in flight ahead of the consumer.
+    A block whose connection drops is requested again from the byte it stopped at.
+    """
+
+    async def fetch_block(start: int) -> bytes:
+        end = min(start + block_size, size) - 1
+        block = bytearray()
+        failures = 0
+
+        while start + len(block) <= end:
+            position = start + len(block)
+            block_headers = {**await resolve_headers(headers), "Range": f"bytes={position}-{end}"}
+            try:
+                async with session.get(url, headers=block_headers) as resp:
+                    if resp.status != 206:
+                        raise Exception(
+                            f"Range request failed with {resp.status}: {await resp.text()}"
+                        )
+                    async for chunk in resp.content.iter_chunked(READ_SIZE):
+                        block += chunk
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+
+            if start + len(block) == position:
+                failures += 1
+                if failures > retries:
+                    raise Exception(f"Range {position}-{end} kept failing.")
+                await asyncio.sleep(failures)
+            else:
+                failures = 0
+
+        return bytes(block[: end - start + 1])
+
+    offsets = iter(range(0, size, block_size))
+    pending: deque[asyncio.Task] = deque()
+
+    for start in offsets:
+        pending.append(asyncio.create_task(fetch_block(start)))
+        if len(pending) == connections:
+            break
+
+    try:
+        while pending:
+            block = await pending.popleft()
+            if (start := next(offsets, None)) is not None:
+                pending.append(asyncio.create_task(fetch_block(start)))
+            yield block
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,2 @@
+from .client import Drive, drive
+from .config import DB, INSTRUCTIONS
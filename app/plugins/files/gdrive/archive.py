@@ -0,0 +1,152 @@
+import asyncio
+import io
+import os
+import shutil
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import TimeoutError as FutureTimeout
+
+ARCHIVE_EXTENSIONS = {"zip": ".zip", "tar": ".tar.gz"}
+
+
+class ArchiveWriter(io.RawIOBase):
+    """
+    Unseekable file object handed to zipfile/tarfile in a worker thread.
+    Written bytes are batched into chunk_size pieces and passed to an asyncio
+    queue on the loop, blocking the thread while the queue is full.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        queue: asyncio.Queue,
+        stop: threading.Event,
+        chunk_size: int,
+    ):
+        super().__init__()
+        self.loop = loop
+        self.queue = queue
+        self.stop = stop
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        # Source bytes read into the archive so far.
+        self.consumed = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+        return len(data)
+
+    def put(self, item: bytes | Exception | None):
+        future = asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop)
+        while True:
+            try:
+                return future.result(timeout=1)
+            except FutureTimeout:
+                if self.stop.is_set():
+                    future.cancel()
+                    raise OSError("Archive consumer stopped.")
+
+    def finish(self):
+        if self.buffer:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+        self.put(None)
+
+
+class CountingReader:
+    """Source file wrapper that adds every read to the writer's consumed count."""
+
+    def __init__(self, file, writer: ArchiveWriter):
+        self.file = file
+        self.writer = writer
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.writer.consumed += len(data)
+        return data
+
+
+def add_to_tar(tar: tarfile.TarFile, path: str, arcname: str, writer: ArchiveWriter):
+    """tar.add, with file contents read through a CountingReader."""
+    tarinfo = tar.gettarinfo(path, arcname)
+    if tarinfo is None:
+        # Sockets, devices and such can't be archived.
+        return
+
+    if tarinfo.isreg():
+        with open(path, "rb") as file:
+            tar.addfile(tarinfo, CountingReader(file, writer))
+    else:
+        tar.addfile(tarinfo)
+
+    if tarinfo.isdir():
+        for name in sorted(os.listdir(path)):
+            add_to_tar(tar, os.path.join(path, name), f"{arcname}/{name}", writer)
+
+
+def write_archive(path: str, archive_format: str, writer: ArchiveWriter):
+    """Runs in a worker thread, compresses path into writer."""
+    try:
+        root = os.path.normpath(path)
+        base_name = os.path.basename(os.path.abspath(root))
+
+        if archive_format == "tar":
+            with tarfile.open(fileobj=writer, mode="w|gz") as tar:
+                add_to_tar(tar, root, base_name, writer)
+        else:
+            with zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+                for dir_path, dir_names, file_names in os.walk(root):
+                    dir_names.sort()
+                    rel_dir = os.path.join(base_name, os.path.relpath(dir_path, root))
+                    if not file_names and not dir_names:
+                        archive.writestr(os.path.normpath(rel_dir) + "/", b"")
+                    for name in sorted(file_names):
+                        source = os.path.join(dir_path, name)
+                        info = zipfile.ZipInfo.from_file(
+                            source, os.path.normpath(f"{rel_dir}/{name}")
+                        )
+                        info.compress_type = zipfile.ZIP_DEFLATED
+                        with open(source, "rb") as file, archive.open(info, "w") as entry:
+                            shutil.copyfileobj(CountingReader(file, writer), entry)
+        writer.finish()
+
+    except Exception as e:
+        if not writer.stop.is_set():
+            writer.put(e)
+
+
+async def iter_archive(
+    path: str, archive_format: str, chunk_size: int, depth: int = 4, store: dict | None = None
+):
+    """
+    Yield a zip or tar.gz of path as it is being compressed, nothing touches the disk.
+    store["archived_size"] follows the source bytes compressed so far.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[bytes | Exception | None] = asyncio.Queue(maxsize=depth)
+    stop = threading.Event()
+    writer = ArchiveWriter(loop, queue, stop, chunk_size)
+    thread_task = asyncio.create_task(
+        asyncio.to_thread(write_archive, path, archive_format, writer), name="drive_archive"
+    )
+
+    try:
+        while (chunk := await queue.get()) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            if store is not None:
+                store["archived_size"] = writer.consumed
+            yield chunk
+    finally:
+        stop.set()
+        # Unblock a put waiting on a full queue, the writer then sees stop.
+        while not queue.empty():
+            queue.get_nowait()
+        await asyncio.shield(thread_task)
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from ub_core import BOT, Message
+
+from app.plugins.files.gdrive import DB, drive
+
+
+@BOT.add_cmd("gsetup")
+async def gdrive_creds_setup(bot: BOT, message: Message):
+    """
+    CMD: GSETUP
+    INFO: Generated and save O-Auth Creds Json to bot.
+    USAGE: .gsetup {reply to credentials.json file}
+    """
+
+    try:
+        assert message.replied.document.file_name == "credentials.json"
+    except (AssertionError, AttributeError):
+        await message.reply("credentials.json not found.")
+        return
+
+    try:
+        cred_file = await message.replied.download(in_memory=True)
+        cred_file.seek(0)
+        flow = InstalledAppFlow.from_client_config(
+            json.load(cred_file),
+            ["https://www.googleapis.com/auth/drive"],
+        )
+        flow.redirect_uri = "urn:ietf:wg:oauth:2.0:oob"
+        auth_url, state = flow.authorization_url(prompt="consent")
+
+        auth_message = await message.reply(
+            f"Please go to this URL and authorize:\n{auth_url}\n\nReply to this message with the code within 30 seconds.",
+        )
+        code_message = await auth_message.get_response(
+            from_user=message.from_user.id, reply_to_message_id=auth_message.id, timeout=30
+        )
+
+        await auth_message.delete()
+
+        if not code_message:
+            await message.reply("expired")
+            return
+
+        await code_message.delete()
+        await asyncio.to_thread(flow.fetch_token, code=code_message.text)
+        await DB.add_data({"_id": "drive_creds", "creds": json.loads(flow.credentials.to_json())})
+        await drive.set_creds()
+        await message.reply("Creds Saved!")
+    except Exception as e:
+        await message.reply(e)
+
+
+@BOT.add_cmd("agcreds")
+async def set_drive_creds(bot: BOT, message: Message):
+    """
+    CMD: AGCREDS
+    INFO: Add your pre generated O-Auth Creds Json to bot.
+    USAGE: .agcreds {data}
+    """
+    creds = message.input.strip()
+
+    if not creds:
+        await message.reply("Enter Creds!!!")
+        return
+
+    try:
+        creds_json = json.loads(creds)
+        creds = Credentials.from_authorized_user_info(info=creds_json)
+
+        if creds.expired and creds.refresh_token:
+            await asyncio.to_thread(creds.refresh, Request())
+
+        await DB.add_data({"_id": "drive_creds", "creds": json.loads(creds.to_json())})
+        await drive.set_creds()
+        await message.reply("Creds added!")
+    except Exception as e:
+        await message.reply(e)
+
+
+@BOT.add_cmd("rgcreds")
+async def remove_drive_creds(bot: BOT, message: Message):
+    response = await message.reply(
+        "Are you sure you want to delete drive creds?\nreply with y to continue"
+    )
+
+    resp = await response.get_response(from_user=message.from_user.id)
+    if not (resp and resp.text in ("y", "Y")):
+        await response.edit("Aborted!!!")
+        return
+
+    drive.is_authenticated = False
+    drive.tokens.set_creds(None)
+    await DB.delete_data({"_id": "drive_creds"})
+    await response.edit("Creds Deleted Successfully!")
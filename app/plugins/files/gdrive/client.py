@@ -0,0 +1,1344 @@
+﻿import asyncio
+import hashlib
+import json
+import os
+import random
+import secrets
+import time
+from collections import defaultdict, deque
+from functools import wraps
+
+import aiohttp
+from google.oauth2.credentials import Credentials
+from ub_core import BOT, Config, Message, bot
+from ub_core.utils import Download, get_tg_media_details, progress
+from yarl import URL
+
+from app.plugins.files.gdrive.archive import ARCHIVE_EXTENSIONS, iter_archive
+from app.plugins.files.gdrive.config import DB, INSTRUCTIONS
+from app.plugins.files.gdrive.dedupe import (
+    DedupeCache,
+    md5_key,
+    path_key,
+    telegram_key,
+    url_key,
+)
+from app.plugins.files.gdrive.index import DriveIndex
+from app.plugins.files.gdrive.scheduler import TransferScheduler
+from app.plugins.files.gdrive.utils import (
+    ChunkRing,
+    DriveAPIError,
+    PutSizer,
+    TokenManager,
+    UploadSessionExpired,
+    build_batch_body,
+    escape_query,
+    file_md5,
+    parse_batch_response,
+    path_size,
+    url_validators,
+)
+
+
+class Drive:
+    URL_TEMPLATE = "https://drive.google.com/file/d/{media_id}/view?usp=sharing"
+    FOLDER_URL_TEMPLATE = "https://drive.google.com/drive/folders/{media_id}?usp=sharing"
+    FOLDER_MIME = "application/vnd.google-apps.folder"
+    SHORTCUT_MIME = "application/vnd.google-apps.shortcut"
+    DRIVE_ROOT_ID = os.getenv("DRIVE_ROOT_ID", "root")
+    # Point this at a local stand-in to test or benchmark without google.
+    API_HOST = os.getenv("DRIVE_API_HOST", "https://www.googleapis.com")
+    API_URL = f"{API_HOST}/drive/v3"
+    UPLOAD_URL = f"{API_HOST}/upload/drive/v3"
+    BATCH_URL = f"{API_HOST}/batch/drive/v3"
+    # Most sub requests drive accepts in one batch call.
+    BATCH_SIZE = 100
+    FILE_FIELDS = "id, name, mimeType, shortcutDetails"
+    INDEX_PATH = os.getenv("DRIVE_INDEX_PATH", "drive_index.db")
+    # Resumable uploads only accept chunks in multiples of 256KiB.
+    UPLOAD_UNIT = 262144
+    # Bytes sent per resumable PUT, source chunks are coalesced up to this size.
+    # PUT_SIZE is the starting point, uploads then adapt within the min/max bounds.
+    PUT_SIZE = UPLOAD_UNIT * max(int(os.getenv("DRIVE_PUT_SIZE_MB", 16)) * 4, 1)
+    MIN_PUT_SIZE = UPLOAD_UNIT * max(int(os.getenv("DRIVE_MIN_PUT_SIZE_MB", 1)) * 4, 1)
+    MAX_PUT_SIZE = UPLOAD_UNIT * max(int(os.getenv("DRIVE_MAX_PUT_SIZE_MB", 32)) * 4, 1)
+    # Number of PUT buffers, the fetcher fills the spare ones while a PUT is in flight.
+    PIPELINE_DEPTH = int(os.getenv("DRIVE_PIPELINE_DEPTH", 2))
+    if PIPELINE_DEPTH < 1:
+        # Uploads of unknown size would wait forever for a free buffer.
+        raise ValueError("DRIVE_PIPELINE_DEPTH must be at least 1.")
+    # Attempts per chunk before an upload is parked for .gresume
+    MAX_RETRIES = 5
+    # Files uploaded at once by folder uploads.
+    FOLDER_WORKERS = int(os.getenv("DRIVE_FOLDER_WORKERS", 4))
+    # Uploads allowed to run at once, the rest wait in the queue shown by .gjobs
+    MAX_TRANSFERS = int(os.getenv("DRIVE_MAX_TRANSFERS", 2))
+    # fifo, or size to start the smallest queued upload first.
+    QUEUE_ORDER = os.getenv("DRIVE_QUEUE_ORDER", "fifo").lower()
+    # Server side copies running at once in .gclone
+    CLONE_WORKERS = int(os.getenv("DRIVE_CLONE_WORKERS", 8))
+    # Parallel Range requests used by .gdl
+    DOWNLOAD_CONNECTIONS = int(os.getenv("DRIVE_DOWNLOAD_CONNECTIONS", 4))
+
+    def __init__(self):
+        self._aiohttp_session = None
+        self._progress_store: dict[str, dict[str, str | int | asyncio.Task]] = defaultdict(dict)
+        self.tokens = TokenManager()
+        self.index = DriveIndex(client=self, path=self.INDEX_PATH)
+        self.dedupe = DedupeCache(client=self)
+        self.scheduler = TransferScheduler(limit=self.MAX_TRANSFERS, order=self.QUEUE_ORDER)
+        self.is_authenticated = False
+
+    async def async_init(self):
+        if self._aiohttp_session is None:
+            # No total timeout, uploads and downloads stream for as long as the file needs.
+            self._aiohttp_session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(sock_connect=30, sock_read=60)
+            )
+            Config.EXIT_TASKS.append(self._aiohttp_session.close)
+        await self.set_creds()
+
+    async def set_creds(self):
+        cred_data = await DB.find_one({"_id": "drive_creds"})
+        if not cred_data:
+            self.is_authenticated = False
+            self.tokens.set_creds(None)
+            return
+
+        self.tokens.set_creds(
+            Credentials.from_authorized_user_info(
+                info=cred_data["creds"], scopes=["https://www.googleapis.com/auth/drive"]
+            )
+        )
+        self.is_authenticated = True
+        self.start_index()
+
+    def start_index(self, rebuild: bool = False):
+        task = asyncio.create_task(self.index.start(rebuild=rebuild), name="drive_index")
+        task.add_done_callback(self._log_index_error)
+
+    @staticmethod
+    def _log_index_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            bot.log.error(f"Drive index unavailable, using live queries: {task.exception()}")
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        return self._aiohttp_session
+
+    async def auth_headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {await self.tokens.get_token()}"}
+
+    def media_url(self, file_id: str) -> str:
+        return f"{self.API_URL}/files/{file_id}?alt=media&supportsAllDrives=true"
+
+    def ensure_creds(self, func):
+        @wraps(func)
+        async def inner(bot: BOT, message: Message):
+            if not self.is_authenticated:
+                await message.reply(INSTRUCTIONS)
+            else:
+                await func(bot, message)
+
+        return inner
+
+    async def request(
+        self, method: str, path: str, params: dict | None = None, json: dict | None = None
+    ) -> dict:
+        """
+        :param method: HTTP method.
+        :param path: Path relative to API_URL, like files/{id}.
+        :return: Decoded json body, empty for 204 responses.
+        """
+        headers = await self.auth_headers()
+        async with self._aiohttp_session.request(
+            method=method, url=f"{self.API_URL}/{path}", params=params, json=json, headers=headers
+        ) as resp:
+            if resp.status == 204:
+                return {}
+
+            data = await resp.json(content_type=None)
+
+            if resp.status >= 400:
+                raise DriveAPIError.from_response(resp.status, data)
+
+            return data
+
+    async def batch(
+        self, requests: list[tuple[str, str, dict | None, dict | None]]
+    ) -> list[dict | DriveAPIError]:
+        """
+        :param requests: (method, path, params, json) tuples, same as request()
+        :return: Decoded json or a DriveAPIError for every request, in the same order.
+
+        Packs the requests into multipart batch calls of up to BATCH_SIZE.
+        Sub requests that were rate limited or hit server errors are retried
+        together in a new batch with exponential backoff. A batch call that
+        fails as a whole with an error that isn't worth retrying is raised.
+        """
+        results: list[dict | DriveAPIError | None] = [None] * len(requests)
+        pending = list(range(len(requests)))
+
+        for attempt in range(1, self.MAX_RETRIES + 1):
+            retry = []
+
+            for i in range(0, len(pending), self.BATCH_SIZE):
+                indexes = pending[i : i + self.BATCH_SIZE]
+                try:
+                    responses = await self._send_batch([requests[j] for j in indexes])
+                except Exception as e:
+                    error = e if isinstance(e, DriveAPIError) else DriveAPIError(0, str(e))
+                    # Bad auth or a malformed batch fails the same way on every attempt.
+                    if not error.retryable:
+                        raise error
+                    responses = {}
+                    for j in indexes:
+                        results[j] = error
+
+                for item, j in enumerate(indexes):
+                    if item not in responses:
+                        if results[j] is None:
+                            results[j] = DriveAPIError(0, "Missing from batch response.")
+                        retry.append(j)
+                        continue
+
+                    status, data = responses[item]
+                    if status < 400:
+                        results[j] = data
+                        continue
+
+                    results[j] = DriveAPIError.from_response(status, data)
+                    if results[j].retryable:
+                        retry.append(j)
+
+            if not retry or attempt == self.MAX_RETRIES:
+                break
+
+            bot.log.warning(f"Drive batch: retrying {len(retry)} sub requests, attempt {attempt}")
+            await asyncio.sleep(2**attempt)
+            pending = retry
+
+        return results
+
+    async def _send_batch(
+        self, requests: list[tuple[str, str, dict | None, dict | None]]
+    ) -> dict[int, tuple[int, dict]]:
+        boundary = f"batch_{secrets.token_hex(8)}"
+        headers = {
+            **await self.auth_headers(),
+            "Content-Type": f"multipart/mixed; boundary={boundary}",
+        }
+        body = build_batch_body(requests, URL(self.API_URL).path, boundary)
+
+        async with self._aiohttp_session.post(self.BATCH_URL, data=body, headers=headers) as resp:
+            text = await resp.text()
+            if resp.status >= 400:
+                try:
+                    data = json.loads(text)
+                except ValueError:
+                    data = text
+                raise DriveAPIError.from_response(resp.status, data)
+            response_boundary = resp.headers["Content-Type"].partition("boundary=")[2]
+
+        return parse_batch_response(text, response_boundary.strip('"'))
+
+    async def with_retries(self, func, *args, **kwargs):
+        """Await func(*args, **kwargs), retrying rate limits and server errors with backoff."""
+        for attempt in range(1, self.MAX_RETRIES + 1):
+            try:
+                return await func(*args, **kwargs)
+            except DriveAPIError as e:
+                if attempt == self.MAX_RETRIES or not e.retryable:
+                    raise
+                await asyncio.sleep(2**attempt + random.random())
+
+    async def iter_files(
+        self, query: str, fields: str = FILE_FIELDS, page_size: int = 100, all_drives: bool = False
+    ):
+        """
+        Yields files matching a files.list query, fetching pages as they are consumed.
+        all_drives also includes items living in shared drives.
+        """
+        params = {"q": query, "fields": f"nextPageToken, files({fields})", "pageSize": page_size}
+        if all_drives:
+            params.update(supportsAllDrives="true", includeItemsFromAllDrives="true")
+
+        while True:
+            result = await self.with_retries(self.request, "GET", "files", params=params)
+
+            for file in result.get("files", []):
+                yield file
+
+            if not (next_token := result.get("nextPageToken")):
+                break
+            params["pageToken"] = next_token
+
+    async def get_file(self, file_id: str, fields: str = FILE_FIELDS) -> dict:
+        return await self.request(
+            "GET", f"files/{file_id}", params={"fields": fields, "supportsAllDrives": "true"}
+        )
+
+    async def create_folder(self, name: str, folder_id: str = None) -> dict:
+        return await self.request(
+            "POST",
+            "files",
+            params={"fields": self.FILE_FIELDS},
+            json={
+                "name": name,
+                "mimeType": self.FOLDER_MIME,
+                "parents": [folder_id or self.DRIVE_ROOT_ID],
+            },
+        )
+
+    async def delete_file(self, file_id: str):
+        await self.request("DELETE", f"files/{file_id}")
+
+    async def create_shortcut(self, name: str, target_id: str, folder_id: str = None) -> dict:
+        return await self.request(
+            "POST",
+            "files",
+            params={"fields": "id", "supportsAllDrives": "true"},
+            json={
+                "name": name,
+                "mimeType": self.SHORTCUT_MIME,
+                "parents": [folder_id or self.DRIVE_ROOT_ID],
+                "shortcutDetails": {"targetId": target_id},
+            },
+        )
+
+    async def copy_file(self, file_id: str, name: str, folder_id: str = None) -> dict:
+        """Server side copy, no bytes pass through the bot."""
+        return await self.request(
+            "POST",
+            f"files/{file_id}/copy",
+            params={"fields": "id", "supportsAllDrives": "true"},
+            json={"name": name, "parents": [folder_id or self.DRIVE_ROOT_ID]},
+        )
+
+    async def ensure_folder(self, name: str, folder_id: str = None) -> tuple[str, bool]:
+        """
+        :return: ID of the folder called name inside folder_id and whether it had to be created.
+        """
+        query = (
+            f"'{folder_id or self.DRIVE_ROOT_ID}' in parents"
+            f" and name = '{escape_query(name)}'"
+            f" and mimeType = '{self.FOLDER_MIME}' and trashed=false"
+        )
+        async for folder in self.iter_files(query, fields="id", page_size=1):
+            return folder["id"], False
+
+        folder = await self.create_folder(name, folder_id)
+        return folder["id"], True
+
+    async def list_contents(
+        self,
+        _id: bool = False,
+        limit: int = 10,
+        file_only: bool = False,
+        folder_only: bool = False,
+        search_param: str | None = None,
+        prefix: bool = False,
+        in_folder: str | None = None,
+        live: bool = False,
+    ) -> list[dict[str, str | int]]:
+        """
+        :param _id: The ID of the folder to list files from.
+        :param limit: Number of results to fetch.
+        :param file_only: If True, only list files.
+        :param folder_only: If True, only list folders.
+        :param search_param: A string to search for in file/folder names.
+        :param prefix: If True, only match names starting with search_param.
+        :param in_folder: Restrict a name search to this folder ID.
+        :param live: If True, skip the local index and query drive.
+        :return: A list of dictionaries containing file/folder id, name and mimeType.
+        """
+        if search_param is None:
+            parent, name = self.DRIVE_ROOT_ID, None
+        elif _id:
+            parent, name = search_param, None
+        else:
+            parent, name = in_folder, search_param
+
+        if self.index.ready and not live:
+            try:
+                await self.index.sync()
+            except Exception as e:
+                bot.log.warning(f"Drive index sync failed, results may be stale: {e}")
+
+            return await self.index.search(
+                name=name,
+                prefix=prefix,
+                parent=parent,
+                mime_type=self.FOLDER_MIME if folder_only else None,
+                exclude_mime_type=self.FOLDER_MIME if file_only else None,
+                limit=limit,
+            )
+
+        query_params = ["trashed=false"]
+
+        if folder_only:
+            query_params.append(f"mimeType = '{self.FOLDER_MIME}'")
+        elif file_only:
+            query_params.append(f"mimeType != '{self.FOLDER_MIME}'")
+
+        if parent is not None:
+            query_params.append(f"'{parent}' in parents")
+        if name is not None:
+            query_params.append(f"name contains '{escape_query(name)}'")
+
+        files = []
+
+        async for file in self.iter_files(" and ".join(query_params), page_size=min(limit, 1000)):
+            if prefix and not file["name"].lower().startswith(name.lower()):
+                continue
+            files.append(file)
+            if len(files) >= limit:
+                break
+
+        return files
+
+    async def upload_from_url(
+        self,
+        file_url: str,
+        is_encoded: bool = False,
+        folder_id: str = None,
+        message_to_edit: Message = None,
+    ):
+        try:
+            async with self.scheduler.slot(
+                file_url, None, self._progress_store[file_url], message_to_edit
+            ):
+                file_id = await self._upload_from_url(
+                    file_url, is_encoded, folder_id, message_to_edit
+                )
+            if file_id is not None:
+                return self.URL_TEMPLATE.format(media_id=file_id)
+        except Exception as e:
+            return f"Error:\n{e}"
+        finally:
+            self._close_store(file_url)
+
+    async def upload_from_telegram(
+        self, media_message: Message, message_to_edit: Message = None, folder_id: str = None
+    ):
+        media = get_tg_media_details(media_message)
+        try:
+            async with self.scheduler.slot(
+                getattr(media, "file_name", "telegram media"),
+                getattr(media, "file_size", 0),
+                self._progress_store[message_to_edit.task_id],
+                message_to_edit,
+            ):
+                file_id = await self._upload_from_telegram(
+                    media_message, message_to_edit, folder_id
+                )
+            if file_id is not None:
+                return self.URL_TEMPLATE.format(media_id=file_id)
+        except Exception as e:
+            return f"Error:\n{e}"
+        finally:
+            self._close_store(message_to_edit.task_id)
+
+    async def upload_from_path(
+        self, path: str, folder_id: str = None, message_to_edit: Message = None
+    ) -> str:
+        is_folder = os.path.isdir(path)
+        try:
+            async with self.scheduler.slot(
+                os.path.basename(os.path.normpath(path)),
+                await asyncio.to_thread(path_size, path),
+                self._progress_store[path],
+                message_to_edit,
+                slots=self.FOLDER_WORKERS if is_folder else 1,
+            ) as transfer:
+                if is_folder:
+                    return await self._upload_folder(
+                        path, folder_id, message_to_edit, workers=transfer.slots
+                    )
+
+                file_id = await self._upload_local_file(path, folder_id, message_to_edit)
+            if file_id is not None:
+                return self.URL_TEMPLATE.format(media_id=file_id)
+        except Exception as e:
+            return f"Error:\n{e}"
+        finally:
+            self._close_store(path)
+
+    async def upload_archive(
+        self,
+        path: str,
+        archive_format: str = "zip",
+        folder_id: str = None,
+        message_to_edit: Message = None,
+    ) -> str:
+        try:
+            async with self.scheduler.slot(
+                os.path.basename(os.path.normpath(path)),
+                await asyncio.to_thread(path_size, path),
+                self._progress_store[path],
+                message_to_edit,
+            ):
+                file_id = await self._upload_archive(
+                    path, archive_format, folder_id, message_to_edit
+                )
+            if file_id is not None:
+                return self.URL_TEMPLATE.format(media_id=file_id)
+        except Exception as e:
+            return f"Error:\n{e}"
+        finally:
+            self._close_store(path)
+
+    async def clone(
+        self, source_id: str, folder_id: str = None, message_to_edit: Message = None
+    ) -> str:
+        try:
+            source = await self.get_file(source_id, fields="id, name, mimeType")
+            if source["mimeType"] != self.FOLDER_MIME:
+                copy = await self.with_retries(
+                    self.copy_file, source["id"], source["name"], folder_id
+                )
+                return self.URL_TEMPLATE.format(media_id=copy["id"])
+
+            return await self._clone_folder(source, folder_id, message_to_edit)
+        except Exception as e:
+            return f"Error:\n{e}"
+        finally:
+            self._close_store(source_id)
+
+    async def resume_upload(self, job: dict, message_to_edit: Message = None):
+        try:
+            async with self.scheduler.slot(
+                job["name"],
+                job["size"] - job["offset"],
+                self._progress_store[job["key"]],
+                message_to_edit,
+            ):
+                file_id = await self._resume_upload(job, message_to_edit)
+            if file_id is not None:
+                return self.URL_TEMPLATE.format(media_id=file_id)
+        except Exception as e:
+            return f"Error:\n{e}"
+        finally:
+            self._close_store(job["key"])
+
+    def _close_store(self, key: str):
+        store = self._progress_store.pop(key, {})
+        store["done"] = True
+        task = store.get("edit_task")
+        if isinstance(task, asyncio.Task):
+            task.cancel()
+
+    async def create_file(self, file_name: str, folder_id: str = None) -> str:
+        """
+        :return: An url pointing to a location in drive.
+        """
+        headers = {
+            "Authorization": f"Bearer {await self.tokens.get_token()}",
+            "Content-Type": "application/json",
+            "X-Upload-Content-Type": "application/octet-stream",
+        }
+        async with self._aiohttp_session.post(
+            url=f"{self.UPLOAD_URL}/files?uploadType=resumable",
+            json={"name": file_name, "parents": [folder_id or self.DRIVE_ROOT_ID]},
+            headers=headers,
+        ) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise Exception(f"Initiate failed: {text}")
+            return resp.headers["Location"]
+
+    async def update_file(self, file_id: str) -> str:
+        """
+        :return: An url to upload new content for an existing file to, keeping its id.
+        """
+        headers = {
+            "Authorization": f"Bearer {await self.tokens.get_token()}",
+            "Content-Type": "application/json",
+            "X-Upload-Content-Type": "application/octet-stream",
+        }
+        async with self._aiohttp_session.patch(
+            url=f"{self.UPLOAD_URL}/files/{file_id}?uploadType=resumable&supportsAllDrives=true",
+            json={},
+            headers=headers,
+        ) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise Exception(f"Initiate update failed: {text}")
+            return resp.headers["Location"]
+
+    async def upload_chunk(self, location, headers, chunk) -> str | None:
+        async with self._aiohttp_session.put(location, headers=headers, data=chunk) as put:
+            if put.status == 308:
+                # Chunk accepted, not finished yet
+                return None
+            elif put.status in (200, 201):
+                # File finished
+                file = await put.json()
+                return file["id"]
+            else:
+                text = await put.text()
+                raise Exception(f"Chunk upload failed with {put.status}: {text}")
+
+    async def get_upload_status(
+        self, location: str, total_size: int | None
+    ) -> tuple[int, str | None]:
+        """
+        Ask drive how much of a resumable session it has committed.
+        :return: The next byte offset to send and the file id if the upload already finished.
+        """
+        headers = {
+            "Content-Range": f"bytes */{"*" if total_size is None else total_size}",
+            "Authorization": f"Bearer {await self.tokens.get_token()}",
+        }
+        async with self._aiohttp_session.put(location, headers=headers) as resp:
+            if resp.status in (200, 201):
+                file = await resp.json()
+                return total_size, file["id"]
+            elif resp.status == 308:
+                # Range: bytes=0-N, missing if nothing was committed yet
+                committed = resp.headers.get("Range")
+                return int(committed.rsplit("-", 1)[1]) + 1 if committed else 0, None
+            elif resp.status in (404, 410):
+                raise UploadSessionExpired("Drive upload session expired.")
+            else:
+                text = await resp.text()
+                raise Exception(f"Upload status failed with {resp.status}: {text}")
+
+    async def _put_chunk(
+        self,
+        job: dict,
+        start: int,
+        chunk: bytes | memoryview,
+        sizer: PutSizer | None = None,
+        total: int | None = None,
+    ) -> str | None:
+        """
+        PUT a chunk, on errors ask drive what it kept and send the rest.
+        After MAX_RETRIES the offset is saved and the job is left for .gresume
+        Jobs without a size send total with their last chunk and * before it.
+        """
+        chunk = memoryview(chunk)
+        chunk_end = start + len(chunk)
+        if job["size"] is not None:
+            total = job["size"]
+
+        for attempt in range(1, self.MAX_RETRIES + 1):
+            headers = {
+                "Content-Range": f"bytes {start}-{chunk_end - 1}/{"*" if total is None else total}",
+                "Authorization": f"Bearer {await self.tokens.get_token()}",
+            }
+            try:
+                return await self.upload_chunk(job["location"], headers, chunk)
+            except Exception as e:
+                if attempt == self.MAX_RETRIES:
+                    raise await self._park_upload(job, start, e)
+
+                bot.log.warning(f"Drive chunk failed, attempt {attempt}: {e}")
+                if sizer is not None:
+                    sizer.failed()
+                await asyncio.sleep(2**attempt)
+
+                try:
+                    committed, file_id = await self.get_upload_status(job["location"], total)
+                except UploadSessionExpired:
+                    await self.forget_upload(job)
+                    raise
+                except Exception:
+                    continue
+
+                if file_id is not None:
+                    return file_id
+
+                if not start <= committed <= chunk_end:
+                    error = Exception(f"Drive committed offset {committed} is out of sync.")
+                    raise await self._park_upload(job, committed, error)
+
+                chunk = chunk[committed - start :]
+                start = committed
+
+    async def _register_upload(
+        self,
+        location: str,
+        name: str,
+        size: int,
+        folder_id: str | None,
+        source: dict,
+        dedupe_keys: list[str] | None = None,
+        replace_id: str | None = None,
+    ) -> dict:
+        """:param replace_id: Drive file the upload replaces the content of, if any."""
+        job = {
+            "key": hashlib.sha1(location.encode()).hexdigest()[:8],
+            "type": "gdrive_upload",
+            "location": location,
+            "name": name,
+            "size": size,
+            "folder_id": folder_id,
+            "source": source,
+            "dedupe_keys": dedupe_keys or [],
+            "replace_id": replace_id,
+            "offset": 0,
+        }
+        # Archives can't be rebuilt byte for byte later, so they are never resumed.
+        if source["type"] != "archive":
+            await self._save_upload(job)
+        return job
+
+    @staticmethod
+    async def _save_upload(job: dict, offset: int | None = None):
+        if offset is not None:
+            job["offset"] = offset
+        await DB.add_data({"_id": f"gdrive_upload_{job["key"]}", **job})
+
+    async def _park_upload(self, job: dict, offset: int, error: Exception) -> Exception:
+        if job["source"]["type"] == "archive":
+            return Exception(f"{error}\n\nArchive uploads can't be resumed, run .gup again.")
+        await self._save_upload(job, offset=offset)
+        return Exception(f"{error}\n\nResume with: .gresume {job["key"]}")
+
+    @staticmethod
+    async def forget_upload(job: dict):
+        await DB.delete_data(id=f"gdrive_upload_{job["key"]}")
+
+    @staticmethod
+    async def get_interrupted_uploads() -> list[dict]:
+        return [job async for job in DB.find({"type": "gdrive_upload"})]
+
+    async def _find_duplicate(
+        self, keys: list[str], name: str, folder_id: str = None
+    ) -> str | None:
+        """
+        :return: ID of a drive file in folder_id with the same content,
+            copied there server side if the cached one lives elsewhere.
+        """
+        if not (file := await self.dedupe.lookup(keys)):
+            return None
+
+        target = folder_id or self.DRIVE_ROOT_ID
+        if target == "root":
+            target = (await self.get_file("root", fields="id"))["id"]
+
+        if target in file.get("parents", []):
+            return file["id"]
+
+        return (await self.copy_file(file["id"], name, target))["id"]
+
+    async def _remember_upload(self, job: dict, file_id: str, md5=None):
+        """Check the streamed md5 against drive's and cache the file under the job's keys."""
+        keys = job.get("dedupe_keys", [])
+        digest = None
+
+        if md5 is not None:
+            digest = md5.hexdigest()
+            drive_md5 = (await self.get_file(file_id, fields="md5Checksum")).get("md5Checksum")
+            if drive_md5 and drive_md5 != digest:
+                await self.delete_file(file_id)
+                raise Exception(f"Checksum mismatch: sent {digest} but drive stored {drive_md5}.")
+            keys = [*keys, md5_key(digest)]
+
+        await self.dedupe.remember(file_id, keys, md5=digest)
+
+    async def _upload_from_url(
+        self,
+        file_url: str,
+        is_encoded: bool = False,
+        folder_id: str = None,
+        message_to_edit: Message = None,
+    ):
+        async with Download(url=file_url, dir="", is_encoded_url=is_encoded) as downloader:
+            store = self._progress_store[file_url]
+            store["size"] = downloader.size_bytes
+            store["done"] = False
+            store["downloaded_size"] = 0
+            store["uploaded_size"] = 0
+            store["edit_task"] = asyncio.create_task(
+                self.progress_worker(store, message_to_edit), name="url_drive_up_prog"
+            )
+
+            file_session = downloader.file_response_session
+            file_session.raise_for_status()
+
+            dedupe_keys = []
+            if key := url_key(file_url, downloader.size_bytes, file_session.headers):
+                dedupe_keys.append(key)
+                if file_id := await self._find_duplicate(
+                    dedupe_keys, downloader.file_name, folder_id
+                ):
+                    return file_id
+
+            job = await self._register_upload(
+                location=await self.create_file(downloader.file_name, folder_id),
+                name=downloader.file_name,
+                size=downloader.size_bytes,
+                folder_id=folder_id,
+                source={
+                    "type": "url",
+                    "url": file_url,
+                    "is_encoded": is_encoded,
+                    "validators": url_validators(file_session),
+                },
+                dedupe_keys=dedupe_keys,
+            )
+            file_id = await self._pipe_to_drive(
+                job, downloader.iter_chunks(2 * self.UPLOAD_UNIT), store
+            )
+
+        store["done"] = True
+        return file_id
+
+    def _put_size(self, remaining: int, size: int) -> int:
+        """size, shrunk to the smallest 256KiB multiple that fits small files."""
+        units = max(-(-remaining // self.UPLOAD_UNIT), 1)
+        return min(size, units * self.UPLOAD_UNIT)
+
+    async def _pipe_to_drive(self, job: dict, chunk_iter, store: dict, start=0):
+        """
+        Runs the source iterator in its own task so the next chunks are fetched
+        while the current unit is uploading.
+        Buffers start at PUT_SIZE and grow up to MAX_PUT_SIZE as the sizer raises it.
+        """
+        if job["size"] is None:
+            # The drainer holds one extra buffer to find the last chunk.
+            remaining, depth = self.MAX_PUT_SIZE, self.PIPELINE_DEPTH + 1
+        else:
+            remaining, depth = job["size"] - start, self.PIPELINE_DEPTH
+
+        ring = ChunkRing(depth=depth, unit_size=self._put_size(remaining, self.MAX_PUT_SIZE))
+        ring.target_size = self._put_size(remaining, self.PUT_SIZE)
+        # Only a stream sent from the first byte can be hashed.
+        md5 = hashlib.md5() if start == 0 else None
+
+        fetch_task = asyncio.create_task(ring.fill(chunk_iter, store), name="drive_fetch")
+        try:
+            file_id = await self._drain_chunks(job, ring, store, start, md5)
+        finally:
+            fetch_task.cancel()
+
+        if file_id is None and not job["size"]:
+            # Nothing was PUT for an empty file, finalise the session explicitly.
+            _, file_id = await self.get_upload_status(job["location"], 0)
+
+        if file_id is not None:
+            await self.forget_upload(job)
+            await self._remember_upload(job, file_id, md5)
+        return file_id
+
+    async def _drain_chunks(
+        self, job: dict, ring: ChunkRing, store: dict, start: int = 0, md5=None
+    ) -> str | None:
+        """
+        Consumer half of the pipeline, PUTs filled buffers in order
+        and resizes the units still to be filled from how each PUT went.
+        Each buffer is hashed in a worker thread while it is being PUT.
+        """
+        file_id = None
+        sizer = PutSizer(
+            start=ring.target_size,
+            min_size=min(self.MIN_PUT_SIZE, ring.unit_size),
+            max_size=ring.unit_size,
+        )
+
+        total = job["size"]
+        chunk = await ring.filled.get()
+
+        while chunk is not None:
+            if isinstance(chunk, Exception):
+                raise await self._park_upload(job, start, chunk)
+
+            if job["size"] is None:
+                # Only the last PUT may carry the total, look one buffer ahead for it.
+                next_chunk = await ring.filled.get()
+                total = start + len(chunk) if next_chunk is None else None
+
+            put_start = time.perf_counter()
+            put = self._put_chunk(job, start, chunk, sizer, total)
+            if md5 is None:
+                file_id = await put
+            else:
+                file_id, _ = await asyncio.gather(put, asyncio.to_thread(md5.update, chunk))
+            sizer.record(len(chunk), time.perf_counter() - put_start)
+            ring.target_size = sizer.size
+
+            ring.release(chunk)
+            start += len(chunk)
+            store["uploaded_size"] += len(chunk)
+            store["put_size"] = sizer.size
+            store["put_rate"] = sizer.rate
+
+            chunk = next_chunk if job["size"] is None else await ring.filled.get()
+
+        return file_id
+
+    async def _upload_from_telegram(
+        self, media_message: Message, message_to_edit: Message = None, folder_id: str = None
+    ):
+        media = get_tg_media_details(media_message)
+
+        store = self._progress_store[message_to_edit.task_id]
+        store["size"] = getattr(media, "file_size", 0)
+        store["done"] = False
+        store["downloaded_size"] = 0
+        store["uploaded_size"] = 0
+        store["edit_task"] = asyncio.create_task(
+            self.progress_worker(store, message_to_edit), name="tg_drive_up_prog"
+        )
+
+        dedupe_keys = [telegram_key(media)]
+        if file_id := await self._find_duplicate(
+            dedupe_keys, getattr(media, "file_name"), folder_id
+        ):
+            return file_id
+
+        job = await self._register_upload(
+            location=await self.create_file(getattr(media, "file_name"), folder_id),
+            name=getattr(media, "file_name"),
+            size=getattr(media, "file_size", 0),
+            folder_id=folder_id,
+            source={
+                "type": "telegram",
+                "chat_id": media_message.chat.id,
+                "message_id": media_message.id,
+                "validators": {"file_unique_id": media.file_unique_id},
+            },
+            dedupe_keys=dedupe_keys,
+        )
+        return await self._pipe_to_drive(job, self._iter_telegram(media_message, 0), store)
+
+    async def _upload_local_file(
+        self,
+        path: str,
+        folder_id: str = None,
+        message_to_edit: Message = None,
+        replace_id: str | None = None,
+    ) -> str | None:
+        store = self._progress_store[path]
+        store["size"] = os.path.getsize(path)
+        store["done"] = False
+        store["downloaded_size"] = 0
+        store["uploaded_size"] = 0
+        store["edit_task"] = asyncio.create_task(
+            self.progress_worker(store, message_to_edit), name="file_drive_up_prog"
+        )
+
+        file_id = await self._upload_file(path, folder_id, store, replace_id=replace_id)
+        store["done"] = True
+        return file_id
+
+    async def _upload_file(
+        self,
+        path: str,
+        folder_id: str | None,
+        store: dict,
+        md5: str | None = None,
+        replace_id: str | None = None,
+    ) -> str | None:
+        """
+        :param md5: The file's md5 if the caller already read it.
+        :param replace_id: Drive file with the same name to upload the new content into,
+            instead of adding a second file next to it.
+        """
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+
+        dedupe_keys = [path_key(path)]
+        # A copy of a duplicate would be a second file with the name, not an update.
+        file_id = None if replace_id else await self._find_duplicate(dedupe_keys, name, folder_id)
+
+        if not file_id and not replace_id:
+            # Same bytes uploaded from another path, or from this one before its mtime changed.
+            md5 = md5 or await asyncio.to_thread(file_md5, path)
+            dedupe_keys.append(md5_key(md5))
+            if file_id := await self._find_duplicate(dedupe_keys[1:], name, folder_id):
+                await self.dedupe.remember(file_id, dedupe_keys[:1], md5=md5)
+
+        if file_id:
+            store["downloaded_size"] += size
+            store["uploaded_size"] += size
+            return file_id
+
+        source = {"type": "file", "path": os.path.abspath(path)}
+        source["validators"] = await self._source_validators(source)
+        if replace_id:
+            location = await self.update_file(replace_id)
+        else:
+            location = await self.create_file(name, folder_id)
+        job = await self._register_upload(
+            location=location,
+            name=name,
+            size=size,
+            folder_id=folder_id,
+            source=source,
+            dedupe_keys=dedupe_keys,
+            replace_id=replace_id,
+        )
+        chunk_iter = self._iter_file(path, 0, 2 * self.UPLOAD_UNIT)
+        return await self._pipe_to_drive(job, chunk_iter, store)
+
+    async def _upload_archive(
+        self,
+        path: str,
+        archive_format: str,
+        folder_id: str = None,
+        message_to_edit: Message = None,
+    ) -> str | None:
+        """
+        Stream a zip or tar.gz of a directory into one resumable upload.
+        The archive is built by a worker thread as the upload consumes it,
+        its size is only sent to drive with the last chunk.
+        """
+        store = self._progress_store[path]
+        # Uncompressed size, the archive's own size isn't known until the end,
+        # so progress is shown in source bytes archived.
+        store["size"] = await asyncio.to_thread(path_size, path)
+        store["archived_size"] = 0
+        store["done"] = False
+        store["downloaded_size"] = 0
+        store["uploaded_size"] = 0
+        store["edit_task"] = asyncio.create_task(
+            self.progress_worker(store, message_to_edit), name="archive_drive_up_prog"
+        )
+
+        root = os.path.abspath(os.path.normpath(path))
+        name = os.path.basename(root) + ARCHIVE_EXTENSIONS[archive_format]
+        job = await self._register_upload(
+            location=await self.create_file(name, folder_id),
+            name=name,
+            size=None,
+            folder_id=folder_id,
+            source={"type": "archive", "path": root, "format": archive_format},
+        )
+        chunk_iter = iter_archive(root, archive_format, 2 * self.UPLOAD_UNIT, store=store)
+        file_id = await self._pipe_to_drive(job, chunk_iter, store)
+        store["done"] = True
+        return file_id
+
+    async def _clone_folder(
+        self, source: dict, folder_id: str = None, message_to_edit: Message = None
+    ) -> str:
+        """
+        Recreate a drive folder tree with server side copies.
+        Folders are walked breadth first while CLONE_WORKERS copy the files found so far.
+        """
+        store = self._progress_store[source["id"]]
+        store["action"] = "Cloning in Drive..."
+        store["done"] = False
+        store["size"] = 0
+        store["uploaded_size"] = 0
+        store["files_total"] = 0
+        store["files_done"] = 0
+        store["edit_task"] = asyncio.create_task(
+            self.progress_worker(store, message_to_edit), name="drive_clone_prog"
+        )
+
+        root = await self.with_retries(self.create_folder, source["name"], folder_id)
+        copy_queue: asyncio.Queue[tuple[dict, str] | None] = asyncio.Queue(
+            maxsize=self.CLONE_WORKERS * 4
+        )
+        errors = []
+
+        async def worker():
+            while (item := await copy_queue.get()) is not None:
+                file, parent_id = item
+                try:
+                    if file["mimeType"] == self.SHORTCUT_MIME:
+                        target_id = file.get("shortcutDetails", {}).get("targetId")
+                        await self.with_retries(
+                            self.create_shortcut, file["name"], target_id, parent_id
+                        )
+                    else:
+                        await self.with_retries(self.copy_file, file["id"], file["name"], parent_id)
+                    store["uploaded_size"] += int(file.get("size", 0))
+                except Exception as e:
+                    errors.append(f"{file["name"]}: {e}")
+                store["files_done"] += 1
+
+        workers = [
+            asyncio.create_task(worker(), name="drive_clone_worker")
+            for _ in range(max(self.CLONE_WORKERS, 1))
+        ]
+        folders = deque([(source["id"], root["id"])])
+        folder_count = 1
+
+        try:
+            while folders:
+                source_id, clone_id = folders.popleft()
+                query = f"'{source_id}' in parents and trashed=false"
+                fields = "id, name, mimeType, size, shortcutDetails"
+
+                async for file in self.iter_files(query, fields, page_size=1000, all_drives=True):
+                    if file["mimeType"] == self.FOLDER_MIME:
+                        folder = await self.with_retries(self.create_folder, file["name"], clone_id)
+                        folders.append((file["id"], folder["id"]))
+                        folder_count += 1
+                        continue
+
+                    store["files_total"] += 1
+                    store["size"] += int(file.get("size", 0))
+                    await copy_queue.put((file, clone_id))
+
+            for _ in workers:
+                await copy_queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+
+        store["done"] = True
+
+        summary = (
+            f"{self.FOLDER_URL_TEMPLATE.format(media_id=root["id"])}"
+            f"\n\nFolders: {folder_count} | Files: {store["files_total"] - len(errors)}"
+            f" | Size: {store["uploaded_size"] / 1048576:.2f} mb | Failed: {len(errors)}"
+        )
+        if errors:
+            summary += "\n\n" + "\n".join(errors[:5])
+        return summary
+
+    async def _upload_folder(
+        self, path: str, folder_id: str = None, message_to_edit: Message = None, workers: int = 1
+    ) -> str:
+        """
+        Mirror a local directory tree into drive.
+        Files already in drive with the same name and md5 are skipped,
+        same named files with other content get the new content as a new revision.
+        :param workers: Files uploaded at once, the scheduler slots the folder holds.
+        """
+        store = self._progress_store[path]
+        store["done"] = False
+        store["size"] = 0
+        store["downloaded_size"] = 0
+        store["uploaded_size"] = 0
+        store["files_done"] = 0
+        store["edit_task"] = asyncio.create_task(
+            self.progress_worker(store, message_to_edit), name="folder_drive_up_prog"
+        )
+
+        root = os.path.normpath(path)
+        root_id, _ = await self.ensure_folder(os.path.basename(os.path.abspath(root)), folder_id)
+        folder_ids = {".": (root_id, False)}
+        # (local path, size, drive folder id, the same named file in drive)
+        entries: list[tuple[str, int, str, dict | None]] = []
+
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names.sort()
+            rel_path = os.path.relpath(dir_path, root)
+
+            if rel_path != ".":
+                parent_id, _ = folder_ids[os.path.dirname(rel_path) or "."]
+                folder_name = os.path.basename(rel_path)
+                folder_ids[rel_path] = await self.ensure_folder(folder_name, parent_id)
+
+            drive_folder_id, created = folder_ids[rel_path]
+            remote_files = {}
+
+            if not created:
+                query = f"'{drive_folder_id}' in parents and trashed=false"
+                async for file in self.iter_files(query, "id, name, md5Checksum", page_size=1000):
+                    remote_files[file["name"]] = file
+
+            for name in sorted(file_names):
+                file_path = os.path.join(dir_path, name)
+                if os.path.isfile(file_path):
+                    size = os.path.getsize(file_path)
+                    entries.append((file_path, size, drive_folder_id, remote_files.get(name)))
+
+        store["size"] = sum(entry[1] for entry in entries)
+        store["files_total"] = len(entries)
+
+        queue: asyncio.Queue[tuple[str, int, str, dict | None]] = asyncio.Queue()
+        for entry in entries:
+            queue.put_nowait(entry)
+
+        skipped = 0
+        errors = []
+
+        async def worker():
+            nonlocal skipped
+            while not queue.empty():
+                file_path, size, drive_folder_id, remote = queue.get_nowait()
+                # Google Docs and such have no md5 and can't take new content.
+                remote_md5 = remote.get("md5Checksum") if remote else None
+                try:
+                    local_md5 = await asyncio.to_thread(file_md5, file_path)
+                    if remote_md5 == local_md5:
+                        skipped += 1
+                        store["downloaded_size"] += size
+                        store["uploaded_size"] += size
+                    else:
+                        await self._upload_file(
+                            file_path,
+                            drive_folder_id,
+                            store,
+                            md5=local_md5,
+                            replace_id=remote["id"] if remote_md5 else None,
+                        )
+                except Exception as e:
+                    errors.append(f"{os.path.relpath(file_path, root)}: {e}")
+                store["files_done"] += 1
+
+        worker_count = max(min(workers, len(entries)), 1)
+        await asyncio.gather(*(worker() for _ in range(worker_count)))
+        store["done"] = True
+
+        summary = (
+            f"{self.FOLDER_URL_TEMPLATE.format(media_id=root_id)}"
+            f"\n\nUploaded: {len(entries) - skipped - len(errors)}"
+            f" | Skipped: {skipped} | Failed: {len(errors)}"
+        )
+        if errors:
+            summary += "\n\n" + "\n".join(errors[:5])
+        return summary
+
+    async def _resume_upload(self, job: dict, message_to_edit: Message = None):
+        store = self._progress_store[job["key"]]
+        store["size"] = job["size"]
+        store["done"] = False
+
+        try:
+            offset, file_id = await self.get_upload_status(job["location"], job["size"])
+        except UploadSessionExpired:
+            await self.forget_upload(job)
+            raise
+
+        if file_id is not None:
+            await self.forget_upload(job)
+            await self._remember_upload(job, file_id)
+            return file_id
+
+        source = job["source"]
+        media_message = None
+        if source["type"] == "telegram":
+            media_message = await bot.get_messages(
+                chat_id=source["chat_id"], message_ids=source["message_id"]
+            )
+
+        # Jobs saved before validators were recorded can't be checked.
+        if "validators" in source and (
+            await self._source_validators(source, media_message) != source["validators"]
+        ):
+            # Appending other bytes to the session would leave a corrupt file in drive.
+            await self.forget_upload(job)
+            return await self._restart_upload(job, media_message, message_to_edit)
+
+        store["downloaded_size"] = offset
+        store["uploaded_size"] = offset
+        store["edit_task"] = asyncio.create_task(
+            self.progress_worker(store, message_to_edit), name="drive_resume_prog"
+        )
+
+        if source["type"] == "url":
+            chunk_iter = self._iter_url(source["url"], source["is_encoded"], offset)
+        elif source["type"] == "file":
+            chunk_iter = self._iter_file(source["path"], offset, 2 * self.UPLOAD_UNIT)
+        else:
+            chunk_iter = self._iter_telegram(media_message, offset)
+
+        return await self._pipe_to_drive(job, chunk_iter, store, offset)
+
+    async def _source_validators(self, source: dict, media_message: Message = None) -> dict:
+        """What tells the source of an upload apart from a changed one with the same name."""
+        if source["type"] == "file":
+            stat = await asyncio.to_thread(os.stat, source["path"])
+            return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        if source["type"] == "telegram":
+            return {"file_unique_id": get_tg_media_details(media_message).file_unique_id}
+
+        url = URL(source["url"], encoded=source["is_encoded"])
+        async with self.session.get(url, headers={"Range": "bytes=0-0"}) as resp:
+            resp.raise_for_status()
+            return url_validators(resp)
+
+    async def _restart_upload(
+        self, job: dict, media_message: Message | None, message_to_edit: Message = None
+    ) -> str | None:
+        """Upload a changed source from the start, as a new file unless it replaces one."""
+        source = job["source"]
+        if source["type"] == "url":
+            store_key = source["url"]
+            upload = self._upload_from_url(
+                source["url"], source["is_encoded"], job["folder_id"], message_to_edit
+            )
+        elif source["type"] == "file":
+            store_key = source["path"]
+            upload = self._upload_local_file(
+                source["path"], job["folder_id"], message_to_edit, job.get("replace_id")
+            )
+        else:
+            store_key = message_to_edit.task_id
+            upload = self._upload_from_telegram(media_message, message_to_edit, job["folder_id"])
+
+        try:
+            return await upload
+        finally:
+            self._close_store(store_key)
+
+    async def _iter_url(self, url: str, is_encoded: bool, offset: int):
+        headers = {"Range": f"bytes={offset}-"}
+        async with self._aiohttp_session.get(URL(url, encoded=is_encoded), headers=headers) as resp:
+            resp.raise_for_status()
+            # Server ignored the range, drop what drive already has.
+            skip = 0 if resp.status == 206 else offset
+
+            async for chunk in resp.content.iter_chunked(2 * self.UPLOAD_UNIT):
+                if skip >= len(chunk):
+                    skip -= len(chunk)
+                    continue
+                yield chunk[skip:] if skip else chunk
+                skip = 0
+
+    @staticmethod
+    async def _iter_file(path: str, offset: int, chunk_size: int):
+        with open(path, "rb") as file:
+            file.seek(offset)
+            while chunk := await asyncio.to_thread(file.read, chunk_size):
+                yield chunk
+
+    @staticmethod
+    async def _iter_telegram(media_message: Message, offset: int):
+        # stream_media offsets are counted in 1MiB chunks
+        chunk_offset, skip = divmod(offset, 1048576)
+        # noinspection PyTypeChecker
+        async for chunk in media_message._client.stream_media(
+            message=media_message, offset=chunk_offset
+        ):
+            yield chunk[skip:] if skip else chunk
+            skip = 0
+
+    @staticmethod
+    async def progress_worker(store: dict, message: Message):
+        if not isinstance(message, Message):
+            return
+
+        while not store["done"]:
+            action_str = store.get("action", "Uploading to Drive...")
+
+            if "downloaded_size" in store:
+                action_str += (
+                    f"\nFetched: {store['downloaded_size'] / 1048576:.2f} mb"
+                    f" | Uploaded: {store['uploaded_size'] / 1048576:.2f} mb"
+                )
+
+            if "put_rate" in store:
+                action_str += (
+                    f"\nChunk: {store['put_size'] / 1048576:.2f} mb"
+                    f" @ {store['put_rate'] / 1048576:.2f} mb/s"
+                )
+
+            if "files_total" in store:
+                action_str += f"\nFiles: {store['files_done']}/{store['files_total']}"
+
+            await progress(
+                current_size=store.get("archived_size", store["uploaded_size"]),
+                total_size=store["size"] or 1,
+                response=message,
+                action_str=action_str,
+            )
+            await asyncio.sleep(5)
+
+
+drive = Drive()
+
+
+async def init_task():
+    await drive.async_init()
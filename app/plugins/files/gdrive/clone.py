@@ -0,0 +1,32 @@
+from ub_core import BOT, Message
+
+from app.plugins.files.gdrive import drive
+from app.plugins.files.gdrive.utils import extract_id
+
+
+@BOT.add_cmd(cmd="gclone")
+@drive.ensure_creds
+async def clone_drive_folder(bot: BOT, message: Message):
+    """
+    CMD: GCLONE
+    INFO: Copy a drive folder/file someone shared into your drive, server side.
+    FLAGS:
+        -id: folder id to clone into
+    USAGE:
+        .gclone <folder/file link | id>
+        .gclone -id <folder id> <folder/file link | id>
+    """
+    if "-id" in message.flags:
+        folder_id, _, source = message.filtered_input.partition(" ")
+    else:
+        folder_id, source = None, message.filtered_input
+
+    if not (source_id := extract_id(source)):
+        await message.reply("Invalid Input!!!")
+        return
+
+    response = await message.reply("Cloning...")
+    await response.edit(
+        await drive.clone(source_id, folder_id=folder_id, message_to_edit=response),
+        disable_preview=True,
+    )
@@ -0,0 +1,21 @@
+from ub_core import CustomDB
+
+DB = CustomDB["COMMON_SETTINGS"]
+DEDUPE_DB = CustomDB["GDRIVE_DEDUPE"]
+
+INSTRUCTIONS = """
+Gdrive Credentials and Access token not found!
+
+- Get credentials.json from: https://console.cloud.google.com
+
+<blockquote>Steps:
+• Enable google drive api.
+• Setup consent screen.
+• Select external app.
+• Add yourself in audience.
+• Go back.
+• Add the Google drive scope in data access.
+• Create a desktop app and download the json in credentials section.</blockquote>
+
+- Upload this file to your saved messages and reply to it with .gsetup
+"""
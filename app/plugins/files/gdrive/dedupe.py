@@ -0,0 +1,73 @@
+import hashlib
+import os
+
+from app.plugins.files.gdrive.config import DEDUPE_DB
+from app.plugins.files.gdrive.utils import DriveAPIError
+
+
+def telegram_key(media) -> str:
+    return f"tg_{media.file_unique_id}"
+
+
+def md5_key(md5: str) -> str:
+    return f"md5_{md5}"
+
+
+def path_key(path: str) -> str:
+    stat = os.stat(path)
+    source = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return f"file_{hashlib.sha1(source.encode()).hexdigest()}"
+
+
+def url_key(url: str, size: int, headers) -> str | None:
+    """Only servers that send a validator can tell us the content is unchanged."""
+    validator = headers.get("ETag") or headers.get("Last-Modified")
+    if not validator:
+        return None
+    source = f"{url}|{size}|{validator}"
+    return f"url_{hashlib.sha1(source.encode()).hexdigest()}"
+
+
+class DedupeCache:
+    """
+    Maps upload sources to drive files that already hold the same bytes.
+
+    Telegram media is keyed on file_unique_id, everything that was streamed
+    from the start is also keyed on the md5 drive confirmed for it.
+    Local files and urls are keyed on what identifies their content without
+    reading it (path, size and mtime, or url, size and ETag). Local files that
+    miss are hashed and looked up by md5 before they are uploaded.
+    Entries are dropped on lookup once their drive file is gone.
+    """
+
+    FIELDS = "id, name, parents, md5Checksum, trashed"
+
+    def __init__(self, client):
+        self.client = client
+
+    async def lookup(self, keys: list[str]) -> dict | None:
+        for key in keys:
+            entry = await DEDUPE_DB.find_one({"_id": key})
+            if not entry:
+                continue
+
+            try:
+                file = await self.client.get_file(entry["file_id"], fields=self.FIELDS)
+            except DriveAPIError as e:
+                if e.status != 404:
+                    raise
+                file = None
+
+            if (
+                not file
+                or file.get("trashed")
+                or (entry.get("md5") and entry["md5"] != file.get("md5Checksum"))
+            ):
+                await DEDUPE_DB.delete_data(id=key)
+                continue
+
+            return file
+
+    async def remember(self, file_id: str, keys: list[str], md5: str | None = None):
+        for key in keys:
+            await DEDUPE_DB.add_data({"_id": key, "file_id": file_id, "md5": md5})
@@ -0,0 +1,88 @@
+from ub_core import BOT, Message
+
+from app.plugins.files.download import iter_ranges, ranged_download
+from app.plugins.files.gdrive import drive
+from app.plugins.files.gdrive.utils import DriveAPIError, extract_id
+from app.plugins.files.scratch import scratch
+from app.plugins.files.upload import size_limit, size_over_limit, stream_upload_to_tg
+
+
+@BOT.add_cmd(cmd="gdl")
+@drive.ensure_creds
+async def download_from_drive(bot: BOT, message: Message):
+    """
+    CMD: GDL
+    INFO: Download a file from drive
+    FLAGS:
+        -tg: stream the file straight to telegram without saving it
+    USAGE:
+        .gdl <file id | link>
+        .gdl -tg <file id | link>
+    """
+    response = await message.reply("Checking Input...")
+
+    if not (file_id := extract_id(message.filtered_input)):
+        await response.edit("Invalid Input!!!")
+        return
+
+    try:
+        file = await drive.get_file(file_id, fields="id, name, mimeType, size")
+    except DriveAPIError as e:
+        await response.edit(f"Error:\n{e}")
+        return
+
+    # Folders and google docs have no binary content to fetch.
+    if "size" not in file:
+        await response.edit(f"<code>{file["name"]}</code> is not a downloadable file.")
+        return
+
+    size = int(file["size"])
+    url = drive.media_url(file["id"])
+
+    if "-tg" in message.flags and size_over_limit(size / 1048576, client=bot):
+        await response.edit(
+            f"<code>{file["name"]}</code> is {size / 1048576:.1f} mb,"
+            f" over the {size_limit(bot)} mb TG limit. Use .gdl without -tg."
+        )
+        return
+
+    try:
+        if "-tg" in message.flags:
+            await stream_upload_to_tg(
+                client=bot,
+                chunk_iter=iter_ranges(
+                    url=url,
+                    size=size,
+                    session=drive.session,
+                    headers=drive.auth_headers,
+                    connections=drive.DOWNLOAD_CONNECTIONS,
+                ),
+                file_name=file["name"],
+                file_size=size,
+                chat_id=message.chat.id,
+                reply_to_id=message.reply_id,
+                caption=file["name"],
+                response=response,
+            )
+            await response.delete()
+            return
+
+        async with scratch.job(keep=True) as job:
+            await job.reserve(size, response)
+            downloaded_file = await ranged_download(
+                url=url,
+                file_path=job.path / file["name"],
+                size=size,
+                session=drive.session,
+                headers=drive.auth_headers,
+                connections=drive.DOWNLOAD_CONNECTIONS,
+                response=response,
+            )
+    except Exception as e:
+        await response.edit(f"Error:\n{e}")
+        return
+
+    await response.edit(
+        f"<code>{downloaded_file.path}</code>"
+        f"\n\n<code>{downloaded_file.size}</code> mb\n\n<b>Downloaded.</b>"
+    )
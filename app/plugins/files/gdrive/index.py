@@ -0,0 +1,227 @@
+import asyncio
+import sqlite3
+import time
+
+from ub_core import bot
+
+INDEX_FIELDS = "id, name, mimeType, parents, shortcutDetails, md5Checksum, size"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    parent TEXT,
+    target_id TEXT,
+    md5 TEXT,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_parent ON files (parent);
+CREATE INDEX IF NOT EXISTS files_name ON files (name COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class DriveIndex:
+    """
+    Local sqlite copy of drive metadata.
+    Seeded once with a full listing and then kept current from the changes feed,
+    so searches are answered locally and keep working while drive is unreachable.
+    """
+
+    # Minimum seconds between two change feed syncs triggered by searches.
+    SYNC_INTERVAL = 30
+
+    def __init__(self, client, path: str):
+        self.client = client
+        self.path = path
+        self.ready = False
+        self.last_sync = 0.0
+        self._conn: sqlite3.Connection | None = None
+        # Guards the connection, it is shared with worker threads.
+        self._db_lock = asyncio.Lock()
+        # Keeps a seed and a sync (or two syncs) from reading the same page token.
+        self._sync_lock = asyncio.Lock()
+
+    async def start(self, rebuild: bool = False):
+        """Open the index, seed it if it has no page token yet and catch up with changes."""
+        async with self._sync_lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.row_factory = sqlite3.Row
+                self._conn.executescript(SCHEMA)
+
+            if rebuild or self._get_state("page_token") is None:
+                self.ready = False
+                await self._seed()
+
+            self.ready = True
+
+        await self.sync(force=True)
+
+    async def _seed(self):
+        # Take the token first so changes made during the listing are replayed later.
+        start_token = await self.client.request("GET", "changes/startPageToken")
+        root = await self.client.get_file("root", fields="id")
+
+        rows = [
+            self._to_row(file)
+            async for file in self.client.iter_files(
+                "trashed=false", fields=INDEX_FIELDS, page_size=1000
+            )
+        ]
+
+        async with self._db_lock:
+            await asyncio.to_thread(
+                self._replace_all, rows, start_token["startPageToken"], root["id"]
+            )
+
+        bot.log.info(f"Drive index seeded with {len(rows)} files.")
+
+    async def sync(self, force: bool = False):
+        """Apply pending changes from the changes feed."""
+        if not self.ready or (not force and time.time() - self.last_sync < self.SYNC_INTERVAL):
+            return
+
+        async with self._sync_lock:
+            params = {
+                "pageToken": self._get_state("page_token"),
+                "pageSize": 1000,
+                "includeRemoved": "true",
+                "fields": (
+                    "nextPageToken, newStartPageToken,"
+                    f" changes(fileId, removed, file(trashed, {INDEX_FIELDS}))"
+                ),
+            }
+            # (file id, row) in feed order, row is None for removals.
+            changes: list[tuple[str, tuple | None]] = []
+
+            while True:
+                result = await self.client.request("GET", "changes", params=params)
+
+                for change in result.get("changes", []):
+                    file = change.get("file")
+                    if change.get("removed") or not file or file.get("trashed"):
+                        changes.append((change["fileId"], None))
+                    else:
+                        changes.append((change["fileId"], self._to_row(file)))
+
+                if next_token := result.get("nextPageToken"):
+                    params["pageToken"] = next_token
+                else:
+                    new_token = result["newStartPageToken"]
+                    break
+
+            async with self._db_lock:
+                await asyncio.to_thread(self._apply_changes, changes, new_token)
+
+            self.last_sync = time.time()
+
+    async def search(
+        self,
+        name: str | None = None,
+        prefix: bool = False,
+        parent: str | None = None,
+        mime_type: str | None = None,
+        exclude_mime_type: str | None = None,
+        limit: int = 10,
+    ) -> list[dict[str, str | int]]:
+        """
+        :param name: Case-insensitive text to match in names.
+        :param prefix: Match name at the start instead of anywhere.
+        :param parent: Only return children of this folder.
+        :param mime_type: Only return this mimeType.
+        :param exclude_mime_type: Skip this mimeType.
+        :param limit: Max number of results.
+        :return: File dicts shaped like drive's files.list results.
+        """
+        clauses, args = [], []
+
+        if parent is not None:
+            clauses.append("parent = ?")
+            args.append(parent)
+
+        if name is not None:
+            pattern = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append("name LIKE ? ESCAPE '\\'")
+            args.append(f"{pattern}%" if prefix else f"%{pattern}%")
+
+        if mime_type is not None:
+            clauses.append("mime_type = ?")
+            args.append(mime_type)
+        elif exclude_mime_type is not None:
+            clauses.append("mime_type != ?")
+            args.append(exclude_mime_type)
+
+        query = "SELECT * FROM files"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY name COLLATE NOCASE LIMIT ?"
+
+        async with self._db_lock:
+            if parent == "root":
+                # files only ever list the real root id as parent, never the alias.
+                args[0] = self._get_state("root_id") or parent
+            rows = self._conn.execute(query, (*args, limit)).fetchall()
+
+        return [self._to_file(row) for row in rows]
+
+    async def stats(self) -> dict[str, int | float | bool]:
+        count = 0
+        if self._conn is not None:
+            async with self._db_lock:
+                count = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return {"ready": self.ready, "files": count, "last_sync": self.last_sync}
+
+    def _get_state(self, key: str) -> str | None:
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _replace_all(self, rows: list[tuple], page_token: str, root_id: str):
+        with self._conn:
+            self._conn.execute("DELETE FROM files")
+            self._conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO state VALUES (?, ?)",
+                (("page_token", page_token), ("root_id", root_id)),
+            )
+
+    def _apply_changes(self, changes: list[tuple[str, tuple | None]], page_token: str):
+        with self._conn:
+            for file_id, row in changes:
+                if row is None:
+                    self._conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", row
+                    )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state VALUES (?, ?)", ("page_token", page_token)
+            )
+
+    @staticmethod
+    def _to_row(file: dict) -> tuple:
+        parents = file.get("parents") or [None]
+        return (
+            file["id"],
+            file["name"],
+            file["mimeType"],
+            parents[0],
+            file.get("shortcutDetails", {}).get("targetId"),
+            file.get("md5Checksum"),
+            int(file.get("size", 0)),
+        )
+
+    @staticmethod
+    def _to_file(row: sqlite3.Row) -> dict[str, str | int]:
+        file = {
+            "id": row["id"],
+            "name": row["name"],
+            "mimeType": row["mime_type"],
+            "size": row["size"],
+        }
+        if row["md5"]:
+            file["md5Checksum"] = row["md5"]
+        if row["target_id"]:
+            file["shortcutDetails"] = {"targetId": row["target_id"]}
+        return file
@@ -0,0 +1,65 @@
+import time
+
+from ub_core import BOT, Message
+
+from app.plugins.files.gdrive import drive
+from app.plugins.files.gdrive.scheduler import Transfer
+
+
+def format_transfer(transfer: Transfer, position: int | None = None) -> str:
+    header = f"<code>{transfer.key}</code>: {transfer.name}"
+    total = transfer.total_bytes / 1048576
+
+    if position is not None:
+        size = f"{total:.2f} mb" if transfer.total_bytes else "size unknown"
+        return f"{header}\nQueued #{position} | {size}"
+
+    eta = transfer.eta
+    eta_str = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta is not None else "--:--:--"
+    return (
+        f"{header}"
+        f"\n{transfer.done_bytes / 1048576:.2f}/{total:.2f} mb"
+        f" @ {transfer.rate / 1048576:.2f} mb/s | ETA {eta_str}"
+    )
+
+
+@BOT.add_cmd(cmd="gjobs")
+async def drive_jobs(bot: BOT, message: Message):
+    """
+    CMD: GJOBS
+    INFO: Show running and queued drive uploads.
+    FLAGS:
+        -c: cancel a running or queued upload
+    USAGE:
+        .gjobs
+        .gjobs -c <id>
+    """
+    scheduler = drive.scheduler
+
+    if "-c" in message.flags:
+        key = message.filtered_input.strip()
+        if scheduler.cancel(key):
+            await message.reply(f"Cancelled <code>{key}</code>.")
+        else:
+            await message.reply("Invalid ID.")
+        return
+
+    running, queued = scheduler.running, scheduler.queued
+
+    if not running and not queued:
+        await message.reply("No drive transfers.")
+        return
+
+    slots_used = sum(transfer.slots for transfer in running)
+    text = f"<b>Drive Transfers</b> ({slots_used}/{scheduler.limit} slots in use)"
+
+    if running:
+        text += "\n\n" + "\n\n".join(format_transfer(transfer) for transfer in running)
+
+    if queued:
+        text += "\n\n<b>Queued</b> (" + scheduler.order + "):\n\n" + "\n\n".join(
+            format_transfer(transfer, position)
+            for position, transfer in enumerate(queued, start=1)
+        )
+
+    await message.reply(text)
@@ -0,0 +1,130 @@
+import time
+
+from pyrogram.enums import ParseMode
+from ub_core import BOT, Message
+
+from app.plugins.files.gdrive import drive
+
+
+@BOT.add_cmd("gls")
+@drive.ensure_creds
+async def list_drive(bot: BOT, message: Message):
+    """
+    CMD: GLS
+    INFO: List Files/Folders from Drive
+    FLAGS:
+        -f: list files only
+        -d: list dirs only
+        -id: list via folder id
+        -l: limit of results (10 by default)
+        -p: match names starting with the search term
+        -live: query drive directly instead of the local index
+
+    USAGE:
+        .gls [-f|-d]
+        .gls [-f|-d] abc (lists files/folders matching abc in name)
+        .gls -id <folder id>
+        .gls -id <folder id> abc (searches abc inside that folder)
+        .gls [-f|-d] -l 20 (lists 20 results)
+        .gls -l 20 abc (tries to list 20 results containing abc in name)
+        .gls -p abc (lists files/folders with names starting with abc)
+    """
+    response = await message.reply("Listing...")
+    flags = message.flags
+    filtered_input_chunks = message.filtered_input.split(maxsplit=1)
+
+    kwargs = {
+        "_id": False,
+        "limit": 10,
+        "folder_only": False,
+        "file_only": False,
+        "search_param": None,
+        "prefix": "-p" in flags,
+        "live": "-live" in flags,
+    }
+
+    # Search by ID
+    if "-id" in flags:
+        kwargs["_id"] = True
+    # list folders
+    if "-d" in flags:
+        kwargs["folder_only"] = True
+    # list files
+    if "-f" in flags:
+        kwargs["file_only"] = True
+
+    # limit total number of results
+    if "-l" in flags:
+        kwargs["limit"] = int(filtered_input_chunks[0])
+        # search for specific files/dirs
+        if len(filtered_input_chunks) == 2:
+            kwargs["search_param"] = filtered_input_chunks[1]
+    else:
+        # search for specific files/dirs
+        kwargs["search_param"] = message.filtered_input.strip() or None
+
+    # search inside a folder
+    if kwargs["_id"] and kwargs["search_param"]:
+        folder_and_name = kwargs["search_param"].split(maxsplit=1)
+        if len(folder_and_name) == 2:
+            kwargs["_id"] = False
+            kwargs["in_folder"], kwargs["search_param"] = folder_and_name
+
+    remote_files = await drive.list_contents(**kwargs)
+
+    if not remote_files:
+        await response.edit("No results found.")
+        return
+
+    folders = []
+    files = [""]
+    shortcuts = [""]
+
+    for file in remote_files:
+        url = drive.URL_TEMPLATE.format(media_id=file["id"])
+        mime = file["mimeType"]
+        if mime == drive.FOLDER_MIME:
+            folders.append(f"📁 <a href={url}>{file["name"]}</a>")
+        elif mime == drive.SHORTCUT_MIME:
+            shortcut_details = file.get("shortcutDetails", {})
+            target_id = shortcut_details.get("targetId")
+            if target_id:
+                url = drive.URL_TEMPLATE.format(media_id=target_id)
+            shortcuts.append(f"🔗 <a href={url}>{file["name"]}</a>")
+        else:
+            files.append(f"📄 <a href={url}>{file["name"]}</a>")
+
+    list_str = "Results:\n\n" + "\n".join(folders + shortcuts + files)
+
+    await response.edit(list_str, parse_mode=ParseMode.HTML)
+
+
+@BOT.add_cmd("gindex")
+@drive.ensure_creds
+async def drive_index_status(bot: BOT, message: Message):
+    """
+    CMD: GINDEX
+    INFO: Show or Rebuild the local drive index used by .gls
+    FLAGS:
+        -r: rebuild the index from a full listing
+    USAGE:
+        .gindex | .gindex -r
+    """
+    if "-r" in message.flags:
+        drive.start_index(rebuild=True)
+        await message.reply("Rebuilding drive index in background.")
+        return
+
+    stats = await drive.index.stats()
+
+    if stats["last_sync"]:
+        last_sync = f"{int(time.time() - stats["last_sync"])}s ago"
+    else:
+        last_sync = "never"
+
+    await message.reply(
+        f"<b>Drive Index</b>"
+        f"\nReady: {stats["ready"]}"
+        f"\nFiles: {stats["files"]}"
+        f"\nLast Sync: {last_sync}"
+    )
@@ -0,0 +1,150 @@
+from ub_core import BOT, Message
+
+from app.plugins.files.gdrive import drive
+from app.plugins.files.gdrive.utils import DriveAPIError, extract_id
+
+ALL_DRIVES = {"supportsAllDrives": "true"}
+
+
+def parse_ids(text: str) -> tuple[list[str], list[str]]:
+    """:return: drive IDs found in space separated ids/links, and the invalid entries."""
+    ids, invalid = [], []
+    for entry in text.split():
+        if file_id := extract_id(entry):
+            ids.append(file_id)
+        else:
+            invalid.append(entry)
+    return ids, invalid
+
+
+def summarize(action: str, ids: list[str], results: list) -> str:
+    failed = [(file_id, r) for file_id, r in zip(ids, results) if isinstance(r, DriveAPIError)]
+    text = f"{action}: {len(ids) - len(failed)} | Failed: {len(failed)}"
+    if failed:
+        text += "\n\n" + "\n".join(f"<code>{file_id}</code>: {e}" for file_id, e in failed[:5])
+    return text
+
+
+@BOT.add_cmd(cmd="gdel")
+@drive.ensure_creds
+async def delete_drive_files(bot: BOT, message: Message):
+    """
+    CMD: GDEL
+    INFO: Move drive files/folders to trash, any number at once.
+    FLAGS:
+        -p: delete permanently instead of trashing
+    USAGE:
+        .gdel <id | link> [<id | link> ...]
+        .gdel -p <id | link> [<id | link> ...]
+    """
+    ids, invalid = parse_ids(message.filtered_input)
+    if not ids or invalid:
+        await message.reply(f"Invalid Input!!!\n{" ".join(invalid)}")
+        return
+
+    response = await message.reply(f"Deleting {len(ids)} items...")
+
+    if "-p" in message.flags:
+        requests = [("DELETE", f"files/{file_id}", ALL_DRIVES, None) for file_id in ids]
+        action = "Deleted"
+    else:
+        requests = [("PATCH", f"files/{file_id}", ALL_DRIVES, {"trashed": True}) for file_id in ids]
+        action = "Trashed"
+
+    try:
+        results = await drive.batch(requests)
+    except DriveAPIError as e:
+        await response.edit(f"Error:\n{e}")
+        return
+
+    await response.edit(summarize(action, ids, results))
+
+
+@BOT.add_cmd(cmd="gmv")
+@drive.ensure_creds
+async def move_drive_files(bot: BOT, message: Message):
+    """
+    CMD: GMV
+    INFO: Move drive files/folders into a folder, any number at once.
+    USAGE:
+        .gmv <folder id | link> <id | link> [<id | link> ...]
+    """
+    ids, invalid = parse_ids(message.filtered_input)
+    if len(ids) < 2 or invalid:
+        await message.reply(f"Invalid Input!!!\n{" ".join(invalid)}")
+        return
+
+    folder_id, *ids = ids
+    response = await message.reply(f"Moving {len(ids)} items...")
+
+    try:
+        files = await drive.batch(
+            [
+                ("GET", f"files/{file_id}", {"fields": "parents", **ALL_DRIVES}, None)
+                for file_id in ids
+            ]
+        )
+    except DriveAPIError as e:
+        await response.edit(f"Error:\n{e}")
+        return
+
+    # Keep lookup failures in place so results line up with ids.
+    requests = []
+    results = list(files)
+    for index, (file_id, file) in enumerate(zip(ids, files)):
+        if isinstance(file, DriveAPIError):
+            continue
+        params = {
+            "addParents": folder_id,
+            "removeParents": ",".join(file.get("parents", [])),
+            "fields": "id",
+            **ALL_DRIVES,
+        }
+        requests.append((index, ("PATCH", f"files/{file_id}", params, {})))
+
+    try:
+        moved = await drive.batch([request for _, request in requests])
+    except DriveAPIError as e:
+        await response.edit(f"Error:\n{e}")
+        return
+    for (index, _), result in zip(requests, moved):
+        results[index] = result
+
+    await response.edit(summarize("Moved", ids, results))
+
+
+@BOT.add_cmd(cmd="gshare")
+@drive.ensure_creds
+async def share_drive_files(bot: BOT, message: Message):
+    """
+    CMD: GSHARE
+    INFO: Make drive files/folders viewable by anyone with the link, any number at once.
+    USAGE:
+        .gshare <id | link> [<id | link> ...]
+    """
+    ids, invalid = parse_ids(message.filtered_input)
+    if not ids or invalid:
+        await message.reply(f"Invalid Input!!!\n{" ".join(invalid)}")
+        return
+
+    response = await message.reply(f"Sharing {len(ids)} items...")
+
+    permission = {"role": "reader", "type": "anyone"}
+    try:
+        results = await drive.batch(
+            [("POST", f"files/{file_id}/permissions", ALL_DRIVES, permission) for file_id in ids]
+        )
+    except DriveAPIError as e:
+        await response.edit(f"Error:\n{e}")
+        return
+
+    links = [
+        drive.URL_TEMPLATE.format(media_id=file_id)
+        for file_id, result in zip(ids, results)
+        if not isinstance(result, DriveAPIError)
+    ]
+    text = summarize("Shared", ids, results)
+    if links:
+        text += "\n\n" + "\n".join(links)
+
+    await response.edit(text, disable_preview=True)
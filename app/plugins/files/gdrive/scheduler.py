@@ -0,0 +1,120 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from itertools import count
+
+from ub_core import Message
+
+
+class Transfer:
+    def __init__(self, key: str, name: str, size: int | None, store: dict, slots: int = 1):
+        self.key = key
+        self.name = name
+        # Concurrent streams the transfer runs, folder uploads hold one per worker.
+        self.slots = slots
+        # None when the size is only known once the transfer starts, like urls.
+        self.size = size
+        self.store = store
+        self.task = asyncio.current_task()
+        self.added = time.time()
+        self.started: float | None = None
+        self.ready = asyncio.Event()
+
+    @property
+    def done_bytes(self) -> int:
+        return self.store.get("uploaded_size", 0)
+
+    @property
+    def total_bytes(self) -> int:
+        return self.store.get("size") or self.size or 0
+
+    @property
+    def rate(self) -> float:
+        """Average bytes per second since the transfer started."""
+        if not self.started:
+            return 0.0
+        return self.done_bytes / max(time.time() - self.started, 1)
+
+    @property
+    def eta(self) -> float | None:
+        if not self.rate or not self.total_bytes:
+            return None
+        return max(self.total_bytes - self.done_bytes, 0) / self.rate
+
+
+class TransferScheduler:
+    """
+    Queue for drive transfers of one account.
+    At most `limit` streams run at once, the rest wait in fifo or smallest first order.
+    Cancelling a transfer's task removes it from the queue or stops it mid upload.
+    """
+
+    def __init__(self, limit: int, order: str = "fifo"):
+        self.limit = max(limit, 1)
+        self.order = order
+        self.transfers: dict[str, Transfer] = {}
+        self._ids = count(1)
+
+    @property
+    def running(self) -> list[Transfer]:
+        return [transfer for transfer in self.transfers.values() if transfer.started]
+
+    @property
+    def queued(self) -> list[Transfer]:
+        waiting = [transfer for transfer in self.transfers.values() if not transfer.started]
+        if self.order == "size":
+            # Unknown sizes go last, ties keep their arrival order.
+            waiting.sort(key=lambda transfer: (transfer.size is None, transfer.size or 0))
+        return waiting
+
+    @asynccontextmanager
+    async def slot(
+        self, name: str, size: int | None, store: dict, message: Message = None, slots: int = 1
+    ):
+        """
+        Wait for free slots, the transfer runs inside the with block.
+        :param slots: Streams the transfer wants to run, capped at the limit.
+            transfer.slots is what it may use.
+        """
+        transfer = Transfer(
+            key=str(next(self._ids)),
+            name=name,
+            size=size,
+            store=store,
+            slots=min(max(slots, 1), self.limit),
+        )
+        self.transfers[transfer.key] = transfer
+        self._dispatch()
+
+        try:
+            if not transfer.ready.is_set():
+                if isinstance(message, Message):
+                    position = self.queued.index(transfer) + 1
+                    await message.edit(
+                        f"Queued <code>{name}</code> at #{position}."
+                        f"\nSee or cancel with .gjobs (id <code>{transfer.key}</code>)"
+                    )
+                await transfer.ready.wait()
+
+            yield transfer
+
+        finally:
+            self.transfers.pop(transfer.key, None)
+            self._dispatch()
+
+    def cancel(self, key: str) -> bool:
+        transfer = self.transfers.get(key)
+        if transfer is None or transfer.task is None:
+            return False
+        transfer.task.cancel()
+        return True
+
+    def _dispatch(self):
+        free_slots = self.limit - sum(transfer.slots for transfer in self.running)
+        for transfer in self.queued:
+            # Stop at the first that doesn't fit, so a folder isn't overtaken forever.
+            if transfer.slots > free_slots:
+                break
+            free_slots -= transfer.slots
+            transfer.started = time.time()
+            transfer.ready.set()
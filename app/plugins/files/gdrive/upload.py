@@ -0,0 +1,134 @@
+import asyncio
+import os
+
+from ub_core import BOT, Message
+
+from app.plugins.files.gdrive import drive
+from app.plugins.files.scratch import scratch
+
+
+@BOT.add_cmd(cmd="gup")
+@drive.ensure_creds
+async def upload_to_drive(bot: BOT, message: Message):
+    """
+    CMD: GUP
+    INFO: Upload file to drive
+    FLAGS:
+        -id: folder id
+        -e: if the url is encoded
+        -zip: upload a local folder as one zip
+        -tar: upload a local folder as one tar.gz
+    USAGE:
+        .gup [reply to a message | url | local file/folder path]
+        .gup -id <folder id> [reply to a message | url | local file/folder path]
+        .gup -zip <local folder path>
+
+    Folders are mirrored with their sub folders,
+    files already in drive with the same name and content are skipped.
+    With -zip/-tar the archive is built while it uploads, no copy is kept on disk.
+    """
+    reply = message.replied
+    response = await message.reply("Checking Input...")
+
+    if "-id" in message.flags and not (reply and reply.media):
+        folder_id, _, target = message.filtered_input.partition(" ")
+        target = target.strip()
+    else:
+        folder_id = message.filtered_input if "-id" in message.flags else None
+        target = message.filtered_input
+
+    local_path = None
+
+    if reply and reply.media:
+        upload_coro = drive.upload_from_telegram(reply, response, folder_id=folder_id)
+
+    elif target.startswith("http"):
+        upload_coro = drive.upload_from_url(
+            file_url=target,
+            is_encoded="-e" in message.flags,
+            folder_id=folder_id,
+            message_to_edit=response,
+        )
+
+    elif target and os.path.isdir(target) and {"-zip", "-tar"} & set(message.flags):
+        local_path = target
+        upload_coro = drive.upload_archive(
+            target,
+            archive_format="tar" if "-tar" in message.flags else "zip",
+            folder_id=folder_id,
+            message_to_edit=response,
+        )
+
+    elif target and os.path.exists(target):
+        local_path = target
+        upload_coro = drive.upload_from_path(target, folder_id=folder_id, message_to_edit=response)
+
+    else:
+        await response.edit("Invalid Input!!!")
+        return
+
+    try:
+        if local_path:
+            # Keeps a completed download under downloads/ from being evicted mid-upload.
+            async with scratch.job() as job:
+                await job.claim(local_path)
+                await response.edit(await upload_coro)
+        else:
+            await response.edit(await upload_coro)
+    except asyncio.CancelledError:
+        await response.edit("Cancelled....")
+        raise
+
+
+def format_size(size: int | None) -> str:
+    """Size in mb, ? for sources that didn't report one."""
+    return "?" if size is None else f"{size / 1048576:.2f}"
+
+
+@BOT.add_cmd(cmd="gresume")
+@drive.ensure_creds
+async def resume_drive_upload(bot: BOT, message: Message):
+    """
+    CMD: GRESUME
+    INFO: List or Resume interrupted drive uploads.
+    FLAGS:
+        -c: clear a saved upload without resuming
+    USAGE:
+        .gresume (lists interrupted uploads)
+        .gresume <id>
+        .gresume -c <id>
+    """
+    jobs = {job["key"]: job for job in await drive.get_interrupted_uploads()}
+    key = message.filtered_input.strip()
+
+    if not key:
+        if not jobs:
+            await message.reply("No interrupted uploads.")
+            return
+
+        job_list = "\n\n".join(
+            f"<code>{job["key"]}</code>: {job["name"]}"
+            f"\n{job["offset"] / 1048576:.2f}/{format_size(job["size"])} mb"
+            f" from {job["source"]["type"]}"
+            for job in jobs.values()
+        )
+        await message.reply(f"<b>Interrupted Uploads</b>:\n\n{job_list}")
+        return
+
+    job = jobs.get(key)
+
+    if not job:
+        await message.reply("Invalid ID.")
+        return
+
+    if "-c" in message.flags:
+        await drive.forget_upload(job)
+        await message.reply(f"Cleared <code>{key}</code>.")
+        return
+
+    response = await message.reply(f"Resuming <code>{job["name"]}</code>...")
+    try:
+        await response.edit(await drive.resume_upload(job, message_to_edit=response))
+    except asyncio.CancelledError:
+        await response.edit("Cancelled....")
+        raise
@@ -0,0 +1,344 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+from collections import deque
+from datetime import UTC, datetime
+from urllib.parse import urlencode
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from ub_core import bot
+
+from app.plugins.files.gdrive.config import DB
+
+
+DRIVE_ID_REGEX = re.compile(r"(?:/d/|/folders/|[?&]id=)([\w-]{10,})")
+
+
+def extract_id(link: str) -> str | None:
+    """Return the file id from a drive link or a bare id."""
+    link = link.strip()
+    if match := DRIVE_ID_REGEX.search(link):
+        return match.group(1)
+    if re.fullmatch(r"[\w-]{10,}", link):
+        return link
+    return None
+
+
+def escape_query(value: str) -> str:
+    """Escape a value for use inside a quoted drive query string."""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def file_md5(path: str) -> str:
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "md5").hexdigest()
+
+
+def url_validators(response) -> dict:
+    """Total size and ETag/Last-Modified of a url, from a full or a ranged response."""
+    size = response.content_length
+    if response.status == 206:
+        total = response.headers.get("Content-Range", "").rpartition("/")[2]
+        size = int(total) if total.isdigit() else None
+    validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+    return {"size": size, "validator": validator}
+
+
+def path_size(path: str) -> int:
+    """Size of a file, or of all files under a directory."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(dir_path, name))
+        for dir_path, _, file_names in os.walk(path)
+        for name in file_names
+    )
+
+
+def build_batch_body(
+    requests: list[tuple[str, str, dict | None, dict | None]], base_path: str, boundary: str
+) -> str:
+    """
+    :param requests: (method, path, params, json) tuples, paths relative to base_path.
+    :return: multipart/mixed body with one application/http part per request.
+    """
+    parts = []
+    for item, (method, path, params, body) in enumerate(requests):
+        url = f"{base_path}/{path}"
+        if params:
+            url += f"?{urlencode(params)}"
+
+        part = (
+            f"--{boundary}\r\nContent-Type: application/http\r\n"
+            f"Content-ID: <item-{item}>\r\n\r\n{method} {url} HTTP/1.1\r\n"
+        )
+        if body is not None:
+            part += f"Content-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(body)}"
+        parts.append(part + "\r\n")
+    return "".join(parts) + f"--{boundary}--\r\n"
+
+
+def parse_batch_response(body: str, boundary: str) -> dict[int, tuple[int, dict]]:
+    """:return: {request index: (status, decoded json)} from a multipart/mixed batch response."""
+    results = {}
+    for part in body.replace("\r\n", "\n").split(f"--{boundary}"):
+        part_headers, _, http_response = part.strip().partition("\n\n")
+        if not (match := re.search(r"Content-ID:\s*<response-item-(\d+)>", part_headers, re.I)):
+            continue
+
+        status_line, _, rest = http_response.partition("\n")
+        _, _, payload = rest.partition("\n\n")
+        try:
+            data = json.loads(payload) if payload.strip() else {}
+        except ValueError:
+            data = {"error": {"message": payload.strip()}}
+        results[int(match.group(1))] = (int(status_line.split()[1]), data)
+    return results
+
+
+class DriveAPIError(Exception):
+    RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+    def __init__(self, status: int, reason: str, reasons: set[str] | None = None):
+        super().__init__(f"Drive API error {status}: {reason}")
+        self.status = status
+        self.reason = reason
+        # Machine readable reasons from error.errors[].reason
+        self.reasons = reasons or set()
+
+    @classmethod
+    def from_response(cls, status: int, data) -> "DriveAPIError":
+        error = data.get("error", {}) if isinstance(data, dict) else {}
+        reasons = {item.get("reason") for item in error.get("errors", [])}
+        return cls(status, error.get("message", str(data)), reasons)
+
+    @property
+    def retryable(self) -> bool:
+        """Rate limits, server errors and failed connections (status 0) are worth retrying."""
+        if self.status in (0, 429) or self.status >= 500:
+            return True
+        return self.status == 403 and bool(self.reasons & self.RATE_LIMIT_REASONS)
+
+
+class UploadSessionExpired(Exception):
+    pass
+
+
+class ChunkRing:
+    """
+    Up to `depth` upload buffers for the upload pipeline.
+    Downloaded bytes are copied once into a free buffer, full buffers are handed
+    to the uploader as memoryviews and recycled after their PUT completes.
+    Buffers are made on first use at target_size and replaced by bigger ones
+    only when target_size grows, so small or slow uploads never hold unit_size.
+    """
+
+    def __init__(self, depth: int, unit_size: int):
+        # unit_size caps the buffers, target_size is what the next one is filled to.
+        self.unit_size = unit_size
+        self.target_size = unit_size
+        self.depth = max(depth, 1)
+        self.filled: asyncio.Queue[memoryview | Exception | None] = asyncio.Queue()
+        self._free: asyncio.Queue[bytearray] = asyncio.Queue()
+        self._allocated = 0
+
+    async def _get_buffer(self) -> tuple[memoryview, int]:
+        """A free buffer and the size to fill it to."""
+        target = min(self.target_size, self.unit_size)
+
+        if self._free.empty() and self._allocated < self.depth:
+            self._allocated += 1
+            return memoryview(bytearray(target)), target
+
+        buffer = await self._free.get()
+        target = min(self.target_size, self.unit_size)
+        if len(buffer) < target:
+            buffer = bytearray(target)
+        return memoryview(buffer), target
+
+    async def fill(self, chunk_iter, store: dict):
+        """
+        Producer half of the upload pipeline.
+        Waits for a recycled buffer whenever all of them are queued for upload.
+        Ends with None on success or with the raised exception on failure.
+        """
+        try:
+            buffer, target = await self._get_buffer()
+            position = 0
+
+            async for chunk in chunk_iter:
+                store["downloaded_size"] += len(chunk)
+                chunk = memoryview(chunk)
+
+                while chunk:
+                    size = min(len(chunk), target - position)
+                    buffer[position : position + size] = chunk[:size]
+                    position += size
+                    chunk = chunk[size:]
+
+                    if position == target:
+                        self.filled.put_nowait(buffer[:target])
+                        buffer, target = await self._get_buffer()
+                        position = 0
+
+            if position:
+                self.filled.put_nowait(buffer[:position])
+            self.filled.put_nowait(None)
+
+        except Exception as e:
+            self.filled.put_nowait(e)
+
+    def release(self, view: memoryview):
+        self._free.put_nowait(view.obj)
+
+
+class PutSizer:
+    """
+    Picks the size of the next resumable PUT from the ones before it.
+
+    Each PUT's duration is modelled as rtt + size / bandwidth, fitted over the
+    last few PUTs. The size grows while the fixed per-request cost is a large
+    share of a PUT, and is capped so one PUT never takes more than
+    MAX_PUT_SECONDS, which bounds what a failed PUT has to resend.
+    Sizes move at most a factor of 2 per PUT and stay multiples of unit.
+    """
+
+    # Aim for the per-request cost to be at most 1 / OVERHEAD_FACTOR of a PUT.
+    OVERHEAD_FACTOR = 10
+    MAX_PUT_SECONDS = 20
+    WINDOW = 8
+
+    def __init__(self, start: int, min_size: int, max_size: int, unit: int = 262144):
+        self.unit = unit
+        self.min_size = max(min_size // unit, 1) * unit
+        self.max_size = max(max_size // unit * unit, self.min_size)
+        self.size = self._clamp(start)
+        self.rtt = 0.0
+        self.rate = 0.0
+        self._samples: deque[tuple[int, float]] = deque(maxlen=self.WINDOW)
+        self._failed = False
+
+    def failed(self):
+        """A PUT needed a retry, back off and don't learn from its timing."""
+        self._failed = True
+        self.size = self._clamp(self.size // 2)
+
+    def record(self, sent: int, seconds: float):
+        if self._failed or seconds <= 0:
+            self._failed = False
+            return
+
+        self._samples.append((sent, seconds))
+        self.rate = sent / seconds if not self.rate else 0.7 * self.rate + 0.3 * sent / seconds
+
+        if fit := self._fit():
+            self.rtt, bandwidth = fit
+            ideal = min(
+                bandwidth * self.rtt * self.OVERHEAD_FACTOR, bandwidth * self.MAX_PUT_SECONDS
+            )
+        elif not self.rtt and seconds < self.MAX_PUT_SECONDS / 4:
+            # Sizes haven't varied enough to learn the rtt yet, probe upwards.
+            ideal = sent * 4
+        else:
+            ideal = min(self.size, self.rate * self.MAX_PUT_SECONDS)
+
+        # Step half way (on a log scale) towards the ideal to damp noisy fits.
+        self.size = self._clamp(min(max((ideal * self.size) ** 0.5, self.size / 2), self.size * 2))
+
+    def _fit(self) -> tuple[float, float] | None:
+        """
+        Least squares fit of duration = rtt + size / bandwidth.
+        None when the sizes are too close together for the fit to mean anything.
+        """
+        sizes = [size for size, _ in self._samples]
+        if max(sizes) < 1.5 * min(sizes):
+            return None
+
+        count = len(self._samples)
+        mean_size = sum(size for size, _ in self._samples) / count
+        mean_time = sum(seconds for _, seconds in self._samples) / count
+        variance = sum((size - mean_size) ** 2 for size, _ in self._samples)
+        slope = (
+            sum((size - mean_size) * (seconds - mean_time) for size, seconds in self._samples)
+            / variance
+        )
+        if slope <= 0:
+            return None
+
+        return max(mean_time - slope * mean_size, 0.0), 1 / slope
+
+    def _clamp(self, size: float) -> int:
+        size = int(size) // self.unit * self.unit
+        return min(max(size, self.min_size), self.max_size)
+
+
+class TokenManager:
+    """
+    Hands out the cached bearer token and refreshes it in a worker thread
+    a few minutes before it expires.
+    Callers that need a token during a refresh all await the same task.
+    """
+
+    REFRESH_MARGIN = 300
+
+    def __init__(self):
+        self.creds: Credentials | None = None
+        self._refresh_task: asyncio.Task | None = None
+        self._refresh_timer: asyncio.TimerHandle | None = None
+
+    def set_creds(self, creds: Credentials | None):
+        self.creds = creds
+        self._schedule_refresh()
+
+    async def get_token(self) -> str:
+        if self._expires_in() < 60:
+            await self.refresh()
+        return self.creds.token
+
+    async def refresh(self):
+        # A cancelled caller shouldn't cancel the refresh others are waiting on.
+        await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh(), name="gdrive_token_refresh")
+            self._refresh_task.add_done_callback(self._log_refresh_error)
+        return self._refresh_task
+
+    def _expires_in(self) -> float:
+        if not (self.creds and self.creds.token):
+            return 0
+        if not self.creds.expiry:
+            return float("inf")
+        return (self.creds.expiry - datetime.now(UTC).replace(tzinfo=None)).total_seconds()
+
+    async def _refresh(self):
+        creds = self.creds
+        await asyncio.to_thread(creds.refresh, Request())
+        await DB.add_data({"_id": "drive_creds", "creds": json.loads(creds.to_json())})
+        bot.log.info("Gdrive Creds Auto-Refreshed")
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+
+        if not (self.creds and self.creds.refresh_token):
+            return
+
+        delay = self._expires_in() - self.REFRESH_MARGIN
+        if delay == float("inf"):
+            return
+
+        self._refresh_timer = asyncio.get_running_loop().call_later(
+            max(delay, 0), self._start_refresh
+        )
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            bot.log.error(f"Gdrive Creds Refresh failed: {task.exception()}")
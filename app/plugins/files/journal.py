@@ -0,0 +1,60 @@
+import hashlib
+import os
+import time
+
+from app import CustomDB
+
+
+class DownloadJournal:
+    """
+    Url downloads that haven't finished, kept in CustomDB so they survive restarts.
+    Entries are keyed by the url plus the ETag or Last-Modified it was fetched with,
+    so a file that changed on the server never resumes into an old partial.
+    Each entry holds the byte ranges still missing from the partial file.
+    """
+
+    def __init__(self):
+        self.db = CustomDB["DOWNLOAD_JOURNAL"]
+
+    @staticmethod
+    def key(url: str, validator: str) -> str:
+        return hashlib.sha1(f"{url}|{validator}".encode()).hexdigest()[:12]
+
+    async def get(self, key: str) -> dict | None:
+        return await self.db.find_one({"_id": key})
+
+    async def find_partial(self, key: str, size: int) -> dict | None:
+        """The entry if its partial file is still there and sized for this download."""
+        if not (entry := await self.get(key)):
+            return None
+
+        path = entry["path"]
+        if entry["size"] == size and os.path.isfile(path) and os.path.getsize(path) == size:
+            return entry
+
+        await self.remove(key)
+        return None
+
+    async def save(
+        self, key: str, url: str, validator: str, path: str, size: int, segments: list[list[int]]
+    ):
+        await self.db.add_data(
+            {
+                "_id": key,
+                "url": url,
+                "validator": validator,
+                "path": path,
+                "size": size,
+                "segments": segments,
+                "updated": time.time(),
+            }
+        )
+
+    async def remove(self, key: str):
+        await self.db.delete_data(id=key)
+
+    async def entries(self) -> list[dict]:
+        return [entry async for entry in self.db.find()]
+
+
+journal = DownloadJournal()
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+# Probed files remembered at once, oldest are dropped first.
+CACHE_SIZE = 256
+# Telegram scales thumbnails down to 320px anyway.
+THUMB_SIZE = 320
+
+
+class MediaInfo:
+    """Parsed `ffprobe -show_streams -show_format` output of one file."""
+
+    def __init__(self, data: dict):
+        self.streams: list[dict] = data.get("streams", [])
+        self.format: dict = data.get("format", {})
+
+        # Cover art in audio files shows up as a single frame video stream.
+        video = [
+            stream
+            for stream in self.streams
+            if stream.get("codec_type") == "video"
+            and not stream.get("disposition", {}).get("attached_pic")
+        ]
+        self.video_stream: dict = video[0] if video else {}
+
+        self.has_audio: bool = any(s.get("codec_type") == "audio" for s in self.streams)
+        self.has_video: bool = bool(self.video_stream)
+        self.width: int = int(self.video_stream.get("width", 0))
+        self.height: int = int(self.video_stream.get("height", 0))
+
+        duration = self.format.get("duration") or self.video_stream.get("duration") or 0
+        self.seconds: float = float(duration)
+        self.duration: int = int(self.seconds)
+
+    @property
+    def thumb_timestamp(self) -> float:
+        """A frame past any intro fade, the first one for short clips."""
+        return min(self.duration * 0.1, 10.0) if self.duration > 2 else 0.0
+
+
+class MediaProbe:
+    """
+    Runs ffprobe once per file and caches the result by path, mtime and size,
+    so a file edited in place is probed again.
+    Concurrent probes of one file share a single ffprobe process.
+    """
+
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache: OrderedDict[tuple, MediaInfo] = OrderedDict()
+        self.pending: dict[tuple, asyncio.Future] = {}
+
+    async def probe(self, file: Path | str) -> MediaInfo:
+        path = os.path.abspath(file)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        if future := self.pending.get(key):
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The caller running the probe was cancelled, not this one: probe again.
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                return await self.probe(file)
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+
+        try:
+            info = await run_ffprobe(path)
+        except asyncio.CancelledError:
+            # Wake the waiters before the key is dropped, they run their own probe.
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a probe nobody else waited on doesn't log a warning.
+            future.exception()
+            raise
+        else:
+            future.set_result(info)
+            self.cache[key] = info
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return info
+        finally:
+            self.pending.pop(key, None)
+
+
+async def run_ffprobe(path: str) -> MediaInfo:
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe",
+        "-v",
+        "error",
+        "-print_format",
+        "json",
+        "-show_streams",
+        "-show_format",
+        path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+
+    if process.returncode:
+        raise Exception(f"ffprobe failed on {path}: {stderr.decode(errors='ignore').strip()}")
+
+    return MediaInfo(json.loads(stdout or b"{}"))
+
+
+async def get_media_info(file: Path | str) -> MediaInfo:
+    """Probe info of file, empty info if it can't be probed."""
+    try:
+        return await media_probe.probe(file)
+    except Exception:
+        return MediaInfo({})
+
+
+async def take_thumbnail(file: Path | str, info: MediaInfo | None = None) -> str | None:
+    """Grab a frame at the probed thumbnail timestamp, saved next to the file."""
+    info = info or await get_media_info(file)
+
+    if not info.has_video:
+        return None
+
+    thumb = f"{file}.jpg"
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-y",
+        "-ss",
+        str(info.thumb_timestamp),
+        "-i",
+        str(file),
+        "-frames:v",
+        "1",
+        "-vf",
+        f"scale={THUMB_SIZE}:{THUMB_SIZE}:force_original_aspect_ratio=decrease",
+        thumb,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    await process.wait()
+
+    return thumb if os.path.isfile(thumb) else None
+
+
+media_probe = MediaProbe()
@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+from io import BytesIO
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from pyrogram.errors import BadRequest
+from pyrogram.types import Message as PyroMessage
+from ub_core.utils import get_tg_media_details
+
+from app import CustomDB
+
+HASH_BLOCK_SIZE = 1048576
+
+
+def sha256_file(file: Path | str | BytesIO) -> str:
+    sha256 = hashlib.sha256()
+    if isinstance(file, BytesIO):
+        sha256.update(file.getbuffer())
+        return sha256.hexdigest()
+    with open(file, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class FileIdRegistry:
+    """
+    Maps content already on Telegram to a file_id it can be sent with again.
+    Keys are a sha256, url or file_unique_id of the content plus the media kind,
+    so the same bytes sent as a video and as a document are kept apart.
+    A file_id Telegram rejects is dropped and the content is uploaded again.
+    Telegram keeps the file name a file_id was uploaded with, so a send under
+    another name uploads again instead of reusing it.
+    """
+
+    def __init__(self):
+        self.db = CustomDB["TG_FILE_IDS"]
+
+    @staticmethod
+    def key(kind: str, content_key: str) -> str:
+        return f"{kind}:{content_key}"
+
+    @staticmethod
+    async def file_key(kind: str, file: Path | str | BytesIO) -> str:
+        return FileIdRegistry.key(kind, await asyncio.to_thread(sha256_file, file))
+
+    async def get(self, key: str) -> dict | None:
+        return await self.db.find_one({"_id": key})
+
+    async def remember(self, key: str, message: PyroMessage, name: str | None = None):
+        media = get_tg_media_details(message)
+        name = name or getattr(media, "file_name", None)
+        await self.db.add_data({"_id": key, "file_id": media.file_id, "name": name})
+
+    async def forget(self, key: str):
+        await self.db.delete_data(id=key)
+
+    async def send(
+        self,
+        key: str,
+        send_file_id: Callable[[str], Awaitable[PyroMessage]],
+        upload: Callable[[], Awaitable[PyroMessage]],
+        name: str | None = None,
+    ) -> PyroMessage:
+        """
+        :param send_file_id: Sends the content by a cached file_id.
+        :param upload: Uploads the content, used on a miss or a stale file_id.
+        :param name: File name the content must show up with, any if None.
+        """
+        cached = await self.get(key)
+        if cached and (name is None or cached.get("name") == name):
+            try:
+                return await send_file_id(cached["file_id"])
+            except BadRequest:
+                # Expired file reference or a file_id from another account.
+                await self.forget(key)
+
+        sent = await upload()
+        if sent:
+            await self.remember(key, sent, name=name)
+        return sent
+
+
+file_ids = FileIdRegistry()
@@ -1,12 +1,11 @@
 import asyncio
-import shutil
-import time
-from pathlib import Path
 
+from ub_core.utils import get_tg_media_details
 from ub_core.utils.downloader import Download, DownloadedFile
 
 from app import BOT, Message, bot
 from app.plugins.files.download import telegram_download
+from app.plugins.files.scratch import scratch
 from app.plugins.files.upload import upload_to_tg
 
 
@@ -29,12 +28,13 @@ async def rename(bot: BOT, message: Message):
         )
         return
 
-    dl_path = Path("downloads") / str(time.time())
+    dl_path = scratch.new_dir()
 
     await response.edit("Input verified....Starting Download...")
 
     if message.replied:
         dl_obj: None = None
+        size = get_tg_media_details(message.replied).file_size
         download_coro = telegram_download(
             message=message.replied, dir_name=dl_path, file_name=input, response=response
         )
@@ -44,12 +44,17 @@ async def rename(bot: BOT, message: Message):
         dl_obj: Download = await Download.setup(
             url=url, dir=dl_path, message_to_edit=response, custom_file_name=file_name
         )
+        size = int(dl_obj.size * 1048576)
         download_coro = dl_obj.download()
 
     try:
-        downloaded_file: DownloadedFile = await download_coro
-        await upload_to_tg(file=downloaded_file, message=message, response=response)
-        shutil.rmtree(dl_path, ignore_errors=True)
+        async with scratch.job(dl_path) as job:
+            await job.reserve(size, response)
+            downloaded_file: DownloadedFile = await download_coro
+            # The content may be cached under its old name, always send the bytes.
+            await upload_to_tg(
+                file=downloaded_file, message=message, response=response, use_cache=False
+            )
 
     except asyncio.exceptions.CancelledError:
         await response.edit("Cancelled....")
@@ -61,5 +66,6 @@ async def rename(bot: BOT, message: Message):
         await response.edit(str(e))
 
     finally:
+        download_coro.close()
         if dl_obj:
             await dl_obj.close()
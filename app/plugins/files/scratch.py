@@ -0,0 +1,206 @@
+import asyncio
+import os
+import re
+import shutil
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from app import CustomDB, Message, extra_config
+from app.plugins.files.journal import journal
+
+# Dirs plugins create with time.time(), anything else under downloads/ is the user's.
+JOB_DIR_REGEX = re.compile(r"^\d+\.\d+(_parts)?$")
+
+
+class ScratchSpaceFull(Exception):
+    pass
+
+
+def dir_size(path: Path | str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for name in file_names:
+            try:
+                total += os.path.getsize(os.path.join(dir_path, name))
+            except OSError:
+                pass
+    return total
+
+
+class ScratchJob:
+    def __init__(self, space: "ScratchSpace", path: Path):
+        self.space = space
+        self.path = path
+        self.reserved = 0
+        # Kept dirs this job writes into, e.g. the dir of a partial being resumed.
+        self.claimed: set[str] = set()
+
+    async def reserve(self, size: int | None, response: Message | None = None):
+        """Claim size more bytes, evicting old downloads or waiting for jobs as needed."""
+        if size:
+            await self.space.reserve(self, size, response)
+
+    async def claim(self, path: Path | str) -> int:
+        """
+        Take the completed download holding path out of eviction until the job ends.
+        Its bytes move into this job's reservation.
+        :return: Bytes already on disk at path, which need no new reservation
+        """
+        return await self.space.claim(self, path)
+
+
+class ScratchSpace:
+    """
+    Quota for everything plugins write under downloads/.
+    Jobs reserve the bytes they expect to write before writing them, completed
+    downloads are kept until the space is needed and then evicted least recently
+    used first. A job that doesn't fit waits for running jobs to finish, or is
+    refused if nothing could free enough space.
+    Usage is updated per job as it ends, the tree is only walked once at boot.
+    """
+
+    ROOT = Path("downloads")
+
+    def __init__(self, quota_mb: int):
+        self.quota = quota_mb * 1048576
+        self.db = CustomDB["SCRATCH_SPACE"]
+        # Completed job dirs that may be evicted: name -> size, last_used
+        self.kept: dict[str, dict[str, float]] = {}
+        self.jobs: dict[str, ScratchJob] = {}
+        # Files the user put under downloads/ themselves, counted but never touched.
+        self.other = 0
+        self.changed = asyncio.Condition()
+
+    @property
+    def used(self) -> int:
+        kept = sum(entry["size"] for entry in self.kept.values())
+        return int(self.other + kept + sum(job.reserved for job in self.jobs.values()))
+
+    def new_dir(self, suffix: str = "") -> Path:
+        return self.ROOT / f"{time.time()}{suffix}"
+
+    def dir_name(self, path: Path | str) -> str | None:
+        """Name of the dir right under downloads/ that holds path."""
+        relative = Path(os.path.relpath(path, self.ROOT))
+        if relative.parts and relative.parts[0] not in {"..", "."}:
+            return relative.parts[0]
+        return None
+
+    async def sweep(self):
+        """
+        Measure downloads/ at boot and remove what jobs that died with the bot left:
+        dirs whose record still says running, unless a resumable download points
+        into them, and every _parts dir. Job dirs without a record, like downloads
+        from before the quota existed, are adopted with their mtime as last use.
+        """
+        self.ROOT.mkdir(exist_ok=True)
+        records = {record["_id"]: record async for record in self.db.find()}
+        partials = {self.dir_name(entry["path"]) for entry in await journal.entries()}
+
+        for entry in os.scandir(self.ROOT):
+            if not JOB_DIR_REGEX.match(entry.name):
+                self.other += await asyncio.to_thread(dir_size, entry.path)
+                continue
+
+            record = records.get(entry.name, {})
+            crashed = record.get("state") == "running" and entry.name not in partials
+            if entry.name.endswith("_parts") or crashed:
+                await asyncio.to_thread(shutil.rmtree, entry.path, ignore_errors=True)
+                continue
+
+            size = await asyncio.to_thread(dir_size, entry.path)
+            last_used = record.get("last_used", entry.stat().st_mtime)
+            self.kept[entry.name] = {"size": size, "last_used": last_used}
+
+        for name in records.keys() - self.kept.keys():
+            await self.db.delete_data(id=name)
+
+    @asynccontextmanager
+    async def job(self, path: Path | None = None, keep: bool = False):
+        """
+        :param path: Dir the job writes in, a fresh one under downloads/ by default
+        :param keep: Leave the dir as a completed download instead of deleting it
+        """
+        job = ScratchJob(self, path or self.new_dir())
+        self.jobs[job.path.name] = job
+        await self.db.add_data({"_id": job.path.name, "state": "running"})
+
+        try:
+            yield job
+
+        finally:
+            self.jobs.pop(job.path.name, None)
+            if keep and job.path.exists():
+                await self.remember(job.path.name, await asyncio.to_thread(dir_size, job.path))
+            else:
+                await asyncio.to_thread(shutil.rmtree, job.path, ignore_errors=True)
+                await self.db.delete_data(id=job.path.name)
+
+            for name in job.claimed:
+                if (self.ROOT / name).exists():
+                    await self.remember(name, await asyncio.to_thread(dir_size, self.ROOT / name))
+
+            async with self.changed:
+                self.changed.notify_all()
+
+    async def reserve(self, job: ScratchJob, size: int, response: Message | None = None):
+        async with self.changed:
+            if self.quota and size > self.quota:
+                raise ScratchSpaceFull(
+                    f"Needs {size / 1048576:.1f} mb, quota is {self.quota / 1048576:.0f} mb."
+                )
+
+            while self.quota and self.used + size > self.quota:
+                if await self.evict(self.used + size - self.quota):
+                    continue
+
+                if not any(other.reserved for other in self.jobs.values() if other is not job):
+                    raise ScratchSpaceFull(
+                        f"Not enough space: {self.used / 1048576:.1f} of "
+                        f"{self.quota / 1048576:.0f} mb used by files that can't be evicted."
+                    )
+
+                if response:
+                    await response.edit("Waiting for disk space to free up...")
+                await self.changed.wait()
+
+            job.reserved += size
+
+    async def claim(self, job: ScratchJob, path: Path | str) -> int:
+        async with self.changed:
+            if (name := self.dir_name(path)) in self.kept:
+                job.reserved += self.kept.pop(name)["size"]
+                job.claimed.add(name)
+        return os.path.getsize(path) if os.path.isfile(path) else 0
+
+    async def evict(self, needed: int) -> int:
+        """Delete completed downloads, least recently used first, until needed bytes are free."""
+        freed = 0
+        for name in sorted(self.kept, key=lambda name: self.kept[name]["last_used"]):
+            if freed >= needed:
+                break
+            entry = self.kept.pop(name)
+            await asyncio.to_thread(shutil.rmtree, self.ROOT / name, ignore_errors=True)
+            await self.db.delete_data(id=name)
+            freed += entry["size"]
+        return freed
+
+    async def remember(self, name: str, size: int):
+        now = time.time()
+        self.kept[name] = {"size": size, "last_used": now}
+        await self.db.add_data({"_id": name, "state": "done", "last_used": now})
+
+    async def touch(self, path: Path | str):
+        """Mark the completed download holding path as just used."""
+        if (name := self.dir_name(path)) in self.kept:
+            await self.remember(name, self.kept[name]["size"])
+
+
+scratch = ScratchSpace(quota_mb=extra_config.DOWNLOAD_QUOTA_MB)
+
+
+async def init_task():
+    await scratch.sweep()
@@ -0,0 +1,195 @@
+import asyncio
+import io
+import json
+import os
+
+from ub_core.utils import MediaType
+
+from app.plugins.files.probe import media_probe
+
+# Headroom under the part size for the moov/cues ffmpeg writes after -fs is hit.
+VIDEO_SPLIT_MARGIN = 67108864
+# How far back from a cut to look for the keyframe an -ss stream copy starts at.
+KEYFRAME_SEARCH = 60
+# Allowed difference between the parts' total duration and the source's.
+SPLIT_DURATION_TOLERANCE = 1.0
+
+
+class FileRange(io.RawIOBase):
+    """
+    Read-only file object over a byte range of a bigger file.
+    Reads go straight to the original with os.pread, nothing is copied to disk.
+    """
+
+    def __init__(self, path: str, start: int, length: int, name: str):
+        super().__init__()
+        self.fd = os.open(path, os.O_RDONLY)
+        self.start = start
+        self.length = length
+        self.name = name
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.length
+        self.position = min(max(offset, 0), self.length)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self.length - self.position
+        if size < 0 or size > remaining:
+            size = remaining
+        data = os.pread(self.fd, size, self.start + self.position)
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            os.close(self.fd)
+        super().close()
+
+
+class SplitPart:
+    """One `.001`, `.002`... piece of a file that is over the TG limit."""
+
+    def __init__(self, path: str, index: int, start: int, length: int):
+        self.path = path
+        self.start = start
+        self.length = length
+        self.name = f"{os.path.basename(path)}.{index:03d}"
+        self.type = MediaType.DOCUMENT
+        self.size = length / 1048576
+
+    def open(self) -> FileRange:
+        return FileRange(self.path, self.start, self.length, self.name)
+
+
+def split_file(path: str, part_size: int) -> list[SplitPart]:
+    """Cut a file into byte ranges of at most part_size, joinable with cat."""
+    size = os.path.getsize(path)
+    return [
+        SplitPart(path=path, index=index, start=start, length=min(part_size, size - start))
+        for index, start in enumerate(range(0, size, part_size), start=1)
+    ]
+
+
+async def keyframe_before(path: str, seconds: float, start_time: float = 0.0) -> float:
+    """
+    Time of the last video keyframe at or before seconds, where an -ss stream copy
+    of path really starts. Only packet headers are read, nothing is decoded.
+    """
+    target = seconds + start_time
+    process = await asyncio.create_subprocess_exec(
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-read_intervals",
+        f"{max(target - KEYFRAME_SEARCH, 0):.3f}%{target + 0.001:.3f}",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-print_format",
+        "json",
+        path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+
+    if process.returncode:
+        raise Exception(f"ffprobe failed on {path}: {stderr.decode(errors='ignore').strip()}")
+
+    keyframes = [
+        float(packet["pts_time"])
+        for packet in json.loads(stdout or b"{}").get("packets", [])
+        if "K" in packet.get("flags", "") and packet.get("pts_time") not in (None, "N/A")
+    ]
+    keyframes = [pts for pts in keyframes if pts <= target + 0.001]
+    return max(keyframes) - start_time if keyframes else seconds
+
+
+async def split_video(path: str, part_size: int, output_dir: str) -> list[str]:
+    """
+    Losslessly split a video with ffmpeg stream copy, every part playable on its own.
+    Each part is cut by size with -fs. A stream copy with -ss really starts at the
+    keyframe before it, so the next part is cut from where this one really ends:
+    that keyframe plus the part's duration. The pre-roll before each cut is in
+    both parts, nothing is dropped.
+    """
+    info = await media_probe.probe(path)
+    if not info.seconds:
+        raise Exception("Couldn't read video duration.")
+
+    start_time = float(info.format.get("start_time") or 0)
+
+    os.makedirs(output_dir, exist_ok=True)
+    stem, ext = os.path.splitext(os.path.basename(path))
+    parts: list[str] = []
+    start = 0.0
+    # Seconds of the source covered by the parts so far, without the pre-roll repeats.
+    covered = 0.0
+
+    while start < info.seconds - 0.5:
+        part = os.path.join(output_dir, f"{stem}.{len(parts) + 1:03d}{ext}")
+        part_start = await keyframe_before(path, start, start_time)
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-ss",
+            f"{start:.3f}",
+            "-i",
+            path,
+            "-map",
+            "0:v",
+            "-map",
+            "0:a?",
+            "-c",
+            "copy",
+            "-avoid_negative_ts",
+            "make_zero",
+            "-fs",
+            str(part_size - VIDEO_SPLIT_MARGIN),
+            part,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, stderr = await process.communicate()
+
+        if process.returncode:
+            raise Exception(f"ffmpeg failed: {stderr.decode(errors='ignore').strip()}")
+
+        part_info = await media_probe.probe(part)
+        part_end = part_start + part_info.seconds
+        if not part_info.seconds or os.path.getsize(part) > part_size or part_end <= start:
+            raise Exception(f"Couldn't cut a valid part at {start:.1f}s.")
+
+        parts.append(part)
+        covered += part_end - start
+        start = part_end
+
+    if abs(covered - info.seconds) > SPLIT_DURATION_TOLERANCE:
+        raise Exception(
+            f"Parts cover {covered:.1f}s of a {info.seconds:.1f}s video, not splitting."
+        )
+
+    return parts
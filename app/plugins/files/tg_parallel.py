@@ -0,0 +1,190 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from pyrogram import raw
+from pyrogram.errors import AuthBytesInvalid, FloodWait
+from pyrogram.file_id import FileId, FileType
+from pyrogram.session import Auth, Session
+from ub_core.utils import progress
+
+from app import BOT, Config, Message
+
+# GetFile limits must divide 1MiB and offsets must be multiples of the limit.
+TG_DOWNLOAD_PART_SIZE = 1048576
+# Sessions opened per DC, every worker shares one of them.
+MEDIA_SESSIONS = 2
+
+
+class MediaSessionPool:
+    """
+    A few media sessions per client and DC, created on first use and reused
+    by every download after that. Stopped on exit.
+    """
+
+    def __init__(self, size: int = MEDIA_SESSIONS):
+        self.size = size
+        self.sessions: dict[tuple[str, int], list[Session]] = {}
+        self.lock = asyncio.Lock()
+
+    async def get(self, client: BOT, dc_id: int) -> list[Session]:
+        async with self.lock:
+            if not self.sessions:
+                Config.EXIT_TASKS.append(self.stop)
+
+            sessions = self.sessions.setdefault((client.name, dc_id), [])
+            while len(sessions) < self.size:
+                sessions.append(await self.create_session(client, dc_id))
+            return sessions
+
+    @staticmethod
+    async def create_session(client: BOT, dc_id: int) -> Session:
+        test_mode = await client.storage.test_mode()
+
+        if dc_id == await client.storage.dc_id():
+            session = Session(
+                client, dc_id, await client.storage.auth_key(), test_mode, is_media=True
+            )
+            await session.start()
+            return session
+
+        session = Session(
+            client, dc_id, await Auth(client, dc_id, test_mode).create(), test_mode, is_media=True
+        )
+        await session.start()
+
+        # Same retry pyrogram does, exported bytes are sometimes rejected once.
+        for attempt in range(3):
+            exported = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+            try:
+                await session.invoke(
+                    raw.functions.auth.ImportAuthorization(id=exported.id, bytes=exported.bytes)
+                )
+                return session
+            except AuthBytesInvalid:
+                if attempt == 2:
+                    await session.stop()
+                    raise
+
+    async def stop(self):
+        for sessions in self.sessions.values():
+            for session in sessions:
+                await session.stop()
+        self.sessions.clear()
+
+
+def file_location(file_id: FileId):
+    if file_id.file_type == FileType.PHOTO:
+        return raw.types.InputPhotoFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size,
+        )
+    return raw.types.InputDocumentFileLocation(
+        id=file_id.media_id,
+        access_hash=file_id.access_hash,
+        file_reference=file_id.file_reference,
+        thumb_size=file_id.thumbnail_size,
+    )
+
+
+async def parallel_download(
+    client: BOT,
+    file_id: str,
+    file_path: Path,
+    size: int,
+    workers: int = 4,
+    response: Message | None = None,
+) -> Path:
+    """
+    :param file_id: file_id of the media
+    :param file_path: Download path
+    :param size: File size in bytes
+    :param workers: GetFile requests kept in flight
+    :param response: Response to Edit
+    :return: file_path
+
+    Requests 1MiB parts at different offsets concurrently over a small pool of
+    media sessions to the file's DC, each part written straight to its offset.
+    A worker that hits a FloodWait puts its part back and stops, so the download
+    carries on with fewer workers, the last one waits the flood out instead.
+    """
+    decoded = FileId.decode(file_id)
+    location = file_location(decoded)
+    sessions = await media_sessions.get(client, decoded.dc_id)
+
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, "wb") as file:
+        file.truncate(size)
+
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for offset in range(0, size, TG_DOWNLOAD_PART_SIZE):
+        queue.put_nowait(offset)
+
+    downloaded = 0
+    active = max(min(workers, queue.qsize()), 1)
+    started = time.time()
+
+    async def worker(session: Session):
+        nonlocal downloaded, active
+        try:
+            while not queue.empty():
+                offset = queue.get_nowait()
+                try:
+                    result = await session.invoke(
+                        raw.functions.upload.GetFile(
+                            location=location, offset=offset, limit=TG_DOWNLOAD_PART_SIZE
+                        ),
+                        sleep_threshold=0,
+                    )
+                except FloodWait as e:
+                    queue.put_nowait(offset)
+                    # Workers still running pick the part up, the last one waits.
+                    if active > 1:
+                        return
+                    await asyncio.sleep(e.value + 1)
+                    continue
+
+                if not isinstance(result, raw.types.upload.File):
+                    raise Exception("File is served from a CDN, parallel download not supported.")
+
+                os.pwrite(fd, result.bytes, offset)
+                downloaded += len(result.bytes)
+        finally:
+            active -= 1
+
+    async def progress_worker():
+        while response:
+            rate = downloaded / max(time.time() - started, 1) / 1048576
+            await progress(
+                current_size=downloaded,
+                total_size=size or 1,
+                response=response,
+                action_str=f"Downloading... [{active} workers @ {rate:.1f} mb/s]",
+                file_path=file_path,
+            )
+            await asyncio.sleep(5)
+
+    fd = os.open(file_path, os.O_WRONLY)
+    tasks = [
+        asyncio.create_task(worker(sessions[index % len(sessions)]), name="tg_dl_worker")
+        for index in range(active)
+    ]
+    progress_task = asyncio.create_task(progress_worker(), name="tg_dl_prog")
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in (*tasks, progress_task):
+            task.cancel()
+        os.close(fd)
+
+    if downloaded != size:
+        raise Exception(f"Size mismatch: got {downloaded} of {size} bytes.")
+
+    return file_path
+
+
+media_sessions = MediaSessionPool()
@@ -1,42 +1,66 @@
 import asyncio
 import glob
+import mimetypes
 import os
+import shutil
 import time
 from functools import partial
-from typing import Union
-
-from pyrogram.types import ReplyParameters
-from ub_core.utils import (
-    Download,
-    DownloadedFile,
-    MediaType,
-    check_audio,
-    get_duration,
-    progress,
-    take_ss,
+from typing import Awaitable, Callable, Union
+from urllib.parse import unquote, urlparse
+
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from pyrogram.types import (
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
 )
+from pyrogram.types import Message as PyroMessage
+from pyrogram.types import ReplyParameters
+from pyrogram.utils import FileId
+from ub_core.utils import Download, DownloadedFile, MediaType, progress
+
+from app import BOT, Config, Message, extra_config
+from app.plugins.files.download import find_partial, get_session, probe_url, resumable_download
+from app.plugins.files.probe import get_media_info, take_thumbnail
+from app.plugins.files.registry import file_ids
+from app.plugins.files.scratch import ScratchJob, scratch
+from app.plugins.files.split import SplitPart, split_file, split_video
+
+# Telegram only accepts file parts of exactly 512KiB, except the last one.
+TG_PART_SIZE = 524288
+# Files above this must be sent with SaveBigFilePart.
+TG_BIG_FILE_SIZE = 10485760
 
-from app import BOT, Config, Message
+# Telegram albums hold at most 10 items.
+ALBUM_SIZE = 10
 
 UPLOAD_TYPES = Union[BOT.send_audio, BOT.send_document, BOT.send_photo, BOT.send_video]
+ALBUM_MEDIA_TYPES = Union[InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo]
 
 
 async def video_upload(bot: BOT, file: DownloadedFile, has_spoiler: bool) -> UPLOAD_TYPES:
-    thumb = await take_ss(file.path, path=file.path)
-    if not await check_audio(file.path):
+    info = await get_media_info(file.path)
+    thumb = await take_thumbnail(file.path, info)
+    if not info.has_audio:
         return partial(
             bot.send_animation,
             thumb=thumb,
             unsave=True,
             animation=file.path,
-            duration=await get_duration(file.path),
+            duration=info.duration,
+            width=info.width,
+            height=info.height,
             has_spoiler=has_spoiler,
         )
     return partial(
         bot.send_video,
         thumb=thumb,
         video=file.path,
-        duration=await get_duration(file.path),
+        duration=info.duration,
+        width=info.width,
+        height=info.height,
         has_spoiler=has_spoiler,
     )
 
@@ -46,7 +70,8 @@ async def photo_upload(bot: BOT, file: DownloadedFile, has_spoiler: bool) -> UPL
 
 
 async def audio_upload(bot: BOT, file: DownloadedFile, *_, **__) -> UPLOAD_TYPES:
-    return partial(bot.send_audio, audio=file.path, duration=await get_duration(file=file.path))
+    info = await get_media_info(file.path)
+    return partial(bot.send_audio, audio=file.path, duration=info.duration)
 
 
 async def doc_upload(bot: BOT, file: DownloadedFile, *_, **__) -> UPLOAD_TYPES:
@@ -62,13 +87,70 @@ FILE_TYPE_MAP = {
 }
 
 
+async def video_media(file: DownloadedFile, has_spoiler: bool) -> ALBUM_MEDIA_TYPES:
+    # Albums can't hold animations, muted videos go in as plain videos.
+    info = await get_media_info(file.path)
+    return InputMediaVideo(
+        media=file.path,
+        thumb=await take_thumbnail(file.path, info),
+        duration=info.duration,
+        width=info.width,
+        height=info.height,
+        caption=file.name,
+        has_spoiler=has_spoiler,
+    )
+
+
+async def photo_media(file: DownloadedFile, has_spoiler: bool) -> ALBUM_MEDIA_TYPES:
+    return InputMediaPhoto(media=file.path, caption=file.name, has_spoiler=has_spoiler)
+
+
+async def audio_media(file: DownloadedFile, *_, **__) -> ALBUM_MEDIA_TYPES:
+    info = await get_media_info(file.path)
+    return InputMediaAudio(media=file.path, duration=info.duration, caption=file.name)
+
+
+async def doc_media(file: DownloadedFile, *_, **__) -> ALBUM_MEDIA_TYPES:
+    return InputMediaDocument(media=file.path, caption=file.name)
+
+
+# Telegram only mixes photos and videos in one album, audio and documents get their own.
+ALBUM_TYPE_MAP = {
+    MediaType.PHOTO: ("visual", photo_media),
+    MediaType.VIDEO: ("visual", video_media),
+    MediaType.GIF: ("visual", video_media),
+    MediaType.AUDIO: ("audio", audio_media),
+    MediaType.DOCUMENT: ("document", doc_media),
+}
+
+
+# Kind the registry keys an upload under, known before the file is probed.
+REGISTRY_KIND_MAP = {
+    MediaType.PHOTO: "photo",
+    MediaType.DOCUMENT: "document",
+    MediaType.GIF: "video",
+    MediaType.AUDIO: "audio",
+    MediaType.VIDEO: "video",
+}
+
+
 def file_exists(file: str) -> bool:
     return os.path.isfile(file)
 
 
+def size_limit(client: BOT) -> int:
+    """Max upload size in mb."""
+    return 3999 if client.me.is_premium else 1999
+
+
 def size_over_limit(size: int | float, client: BOT) -> bool:
-    limit = 3999 if client.me.is_premium else 1999
-    return size > limit
+    return size > size_limit(client)
+
+
+def upload_size(file: DownloadedFile | SplitPart) -> int:
+    if isinstance(file, SplitPart):
+        return file.length
+    return os.path.getsize(file.path)
 
 
 @BOT.add_cmd(cmd="upload")
@@ -76,16 +158,21 @@ async def upload(bot: BOT, message: Message):
     """
     CMD: UPLOAD
     INFO: Upload Media/Local Files/Plugins to TG.
+        Files over the TG limit are split into .001, .002... parts,
+        videos losslessly at keyframes unless -d is used.
+        Document urls are streamed straight to TG without saving them.
     FLAGS:
         -d: to upload as doc.
         -s: spoiler.
         -bulk: for folder upload.
         -r: file name regex [ to be used with -bulk only ]
+        -a: send as albums of up to 10 [ to be used with -bulk only ]
     USAGE:
         .upload [-d] URL | Path to File | CMD
         .upload -bulk downloads/videos
         .upload -bulk -d -s downloads/videos
         .upload -bulk -r -s downloads/videos/*.mp4 (only uploads mp4)
+        .upload -bulk -a downloads/photos
     """
     input = message.filtered_input
 
@@ -103,101 +190,557 @@ async def upload(bot: BOT, message: Message):
     elif input.startswith("http") and not file_exists(input):
 
         try:
-            async with Download(
-                url=input, dir=os.path.join("downloads", str(time.time())), message_to_edit=response
-            ) as dl_obj:
-                if size_over_limit(dl_obj.size, client=bot):
-                    await response.edit("<b>Aborted</b>, File size exceeds TG Limits!!!")
-                    return
-
-                await response.edit("URL detected in input, Starting Download....")
-                file: DownloadedFile = await dl_obj.download()
-
+            if await url_stream_upload(url=input, message=message, response=response):
+                await response.delete()
+                return
         except asyncio.exceptions.CancelledError:
             await response.edit("Cancelled...")
             return
-
-        except TimeoutError:
-            await response.edit("Download Timeout...")
-            return
-
         except Exception as e:
-            await response.edit(str(e))
+            # Timeouts stringify to nothing.
+            await response.edit(str(e) or type(e).__name__)
             return
 
-    elif file_exists(input):
-        file = DownloadedFile(file=input)
+        # The job stays open through the upload so the file can't be evicted under it.
+        async with scratch.job(keep=True) as job:
+            try:
+                file = await download_url(url=input, job=job, response=response)
 
-        if size_over_limit(file.size, client=bot):
-            await response.edit("<b>Aborted</b>, File size exceeds TG Limits!!!")
-            return
+            except asyncio.exceptions.CancelledError:
+                await response.edit("Cancelled...")
+                return
+
+            except TimeoutError:
+                await response.edit("Download Timeout...")
+                return
+
+            except Exception as e:
+                await response.edit(str(e))
+                return
+
+            await send_file(file=file, message=message, response=response)
+
+    elif file_exists(input):
+        async with scratch.job() as job:
+            # Keeps a completed download under downloads/ from being evicted mid-upload.
+            await job.claim(input)
+            await send_file(file=DownloadedFile(file=input), message=message, response=response)
 
     elif "-bulk" in message.flags:
-        await bulk_upload(message=message, response=response)
-        return
+        async with scratch.job() as job:
+            await job.claim(input)
+            await bulk_upload(message=message, response=response)
 
     else:
         await response.edit("invalid `cmd` | `url` | `file path`!!!")
+
+
+async def download_url(url: str, job: ScratchJob, response: Message) -> DownloadedFile:
+    # Servers that honour ranges go through the journal and can resume later.
+    if (url_info := await probe_url(url, session=get_session())).is_segmentable:
+        size = url_info.size
+        if partial_entry := await find_partial(url=url, url_info=url_info):
+            size -= await job.claim(partial_entry["path"])
+        await job.reserve(size, response)
+        await response.edit("URL detected in input, Starting Download....")
+        downloaded_file = await resumable_download(
+            url=url, url_info=url_info, file_path=job.path / url_info.file_name, response=response
+        )
+        return DownloadedFile(file=downloaded_file.path)
+
+    async with Download(url=url, dir=job.path, message_to_edit=response) as dl_obj:
+        await job.reserve(int(dl_obj.size * 1048576), response)
+        await response.edit("URL detected in input, Starting Download....")
+        return await dl_obj.download()
+
+
+async def send_file(file: DownloadedFile, message: Message, response: Message):
+    if size_over_limit(file.size, client=message._client):
+        await split_upload(file=file, message=message, response=response)
         return
 
     await response.edit("Uploading....")
     await upload_to_tg(file=file, message=message, response=response)
 
 
-async def bulk_upload(message: Message, response: Message):
+class FloodPacer:
+    """
+    Shared pacing for bulk uploads.
+    A FloodWait hit by any worker pauses all of them until it is over,
+    then the failed call is retried.
+    """
+
+    def __init__(self):
+        self.resume_at = 0.0
 
+    async def call(self, func, *args, **kwargs):
+        while True:
+            while (delay := self.resume_at - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await func(*args, **kwargs)
+            except FloodWait as e:
+                self.resume_at = max(self.resume_at, time.monotonic() + e.value + 1)
+
+
+async def bulk_upload(message: Message, response: Message):
     if "-r" in message.flags:
         path_regex = message.filtered_input
     else:
         path_regex = os.path.join(message.filtered_input, "*")
 
-    file_list = [f for f in glob.glob(path_regex) if file_exists(f)]
+    file_list = sorted(f for f in glob.glob(path_regex) if file_exists(f))
 
     if not file_list:
         await response.edit("Invalid Folder path/regex or Folder Empty")
         return
 
-    await response.edit(f"Preparing to upload {len(file_list)} files.")
+    files: list[DownloadedFile] = []
+    skipped: list[str] = []
 
     for file in file_list:
-
         file_info = DownloadedFile(file=file)
-
         if size_over_limit(file_info.size, client=message._client):
-            await response.reply(f"Skipping {file_info.name} due to size exceeding limit.")
+            skipped.append(f"{file_info.name}: size exceeds limit")
+        else:
+            files.append(file_info)
+
+    await response.edit(f"Preparing to upload {len(files)} files.")
+
+    upload_func = album_upload if "-a" in message.flags else pool_upload
+
+    try:
+        done = await upload_func(message=message, response=response, files=files, skipped=skipped)
+    except asyncio.exceptions.CancelledError:
+        await response.edit("Cancelled....")
+        raise
+
+    if not skipped:
+        await response.delete()
+        return
+
+    await response.edit(
+        f"Uploaded {done}/{len(file_list)} files.\n\n<b>Skipped</b>:\n" + "\n".join(skipped)
+    )
+
+
+async def pool_upload(
+    message: Message, response: Message, files: list[DownloadedFile], skipped: list[str]
+) -> int:
+    """
+    Upload files with UPLOAD_WORKERS running at once.
+    Each file is staged in the log chat as soon as it uploads and then copied
+    to the chat in the original order, every copy replying to the previous one.
+    """
+    loop = asyncio.get_running_loop()
+    pacer = FloodPacer()
+    staged: list[asyncio.Future] = [loop.create_future() for _ in files]
+    sent_bytes = [0] * len(files)
+    total_bytes = sum(upload_size(file) for file in files)
+    queue: asyncio.Queue[tuple[int, DownloadedFile]] = asyncio.Queue()
+    done = 0
+
+    for index, file in enumerate(files):
+        queue.put_nowait((index, file))
+
+    async def track_progress(current: int, _total: int, index: int):
+        sent_bytes[index] = current
+
+    async def worker():
+        while not queue.empty():
+            index, file = queue.get_nowait()
+            try:
+                upload_method = await get_upload_method(file, message)
+                staged[index].set_result(
+                    await pacer.call(
+                        upload_method,
+                        chat_id=Config.LOG_CHAT,
+                        message_thread_id=Config.LOG_CHAT_THREAD_ID,
+                        progress=track_progress,
+                        progress_args=(index,),
+                        caption=file.name,
+                    )
+                )
+            except Exception as e:
+                staged[index].set_result(e)
+
+    async def progress_worker():
+        while True:
+            await progress(
+                current_size=sum(sent_bytes),
+                total_size=total_bytes or 1,
+                response=response,
+                action_str=f"Uploading {done}/{len(files)} files...",
+            )
+            await asyncio.sleep(5)
+
+    workers = [
+        asyncio.create_task(worker(), name="bulk_upload_worker")
+        for _ in range(max(min(extra_config.UPLOAD_WORKERS, len(files)), 1))
+    ]
+    progress_task = asyncio.create_task(progress_worker(), name="bulk_upload_prog")
+    reply_to_id = message.reply_id
+
+    try:
+        for file, future in zip(files, staged):
+            staged_message = await future
+
+            if isinstance(staged_message, Exception):
+                skipped.append(f"{file.name}: {staged_message}")
+                continue
+
+            copied = await pacer.call(
+                staged_message.copy,
+                chat_id=message.chat.id,
+                reply_parameters=ReplyParameters(message_id=reply_to_id),
+            )
+            await pacer.call(staged_message.delete)
+            reply_to_id = copied.id
+            done += 1
+
+    finally:
+        for task in (*workers, progress_task):
+            task.cancel()
+
+    return done
+
+
+async def album_upload(
+    message: Message, response: Message, files: list[DownloadedFile], skipped: list[str]
+) -> int:
+    """
+    Send files as albums of up to ALBUM_SIZE, photos and videos together,
+    audio and documents in albums of their own.
+    Thumbnails and durations of a batch are prepared concurrently before it is sent,
+    every album replies to the previous one.
+    """
+    groups: dict[str, list[tuple[DownloadedFile, Callable]]] = {}
+    for file in files:
+        group, media_func = ALBUM_TYPE_MAP[
+            MediaType.DOCUMENT if "-d" in message.flags else file.type
+        ]
+        groups.setdefault(group, []).append((file, media_func))
+
+    batches = [
+        group_files[index : index + ALBUM_SIZE]
+        for group_files in groups.values()
+        for index in range(0, len(group_files), ALBUM_SIZE)
+    ]
+
+    pacer = FloodPacer()
+    has_spoiler = "-s" in message.flags
+    reply_to_id = message.reply_id
+    done = 0
+
+    for batch in batches:
+        await response.edit(f"Uploading {done}/{len(files)} files...")
+
+        try:
+            # Albums need at least 2 items, a lone file is sent normally.
+            if len(batch) == 1:
+                file, _ = batch[0]
+                upload_method = await get_upload_method(file, message)
+                sent = [
+                    await pacer.call(
+                        upload_method,
+                        chat_id=message.chat.id,
+                        reply_parameters=ReplyParameters(message_id=reply_to_id),
+                        caption=file.name,
+                    )
+                ]
+            else:
+                media = await asyncio.gather(
+                    *[media_func(file, has_spoiler) for file, media_func in batch]
+                )
+                sent = await pacer.call(
+                    message._client.send_media_group,
+                    chat_id=message.chat.id,
+                    media=media,
+                    reply_parameters=ReplyParameters(message_id=reply_to_id),
+                )
+
+        except Exception as e:
+            skipped.extend(f"{file.name}: {e}" for file, _ in batch)
             continue
 
-        temp_resp = await response.reply(f"starting to upload `{file_info.name}`")
+        reply_to_id = sent[-1].id
+        done += len(batch)
 
-        await upload_to_tg(file=file_info, message=message, response=temp_resp)
-        await asyncio.sleep(3)
+    return done
 
-    await response.delete()
 
+async def split_upload(file: DownloadedFile, message: Message, response: Message):
+    """Upload a file over the TG limit as parts, in order and a few at once."""
+    part_size = size_limit(message._client) * 1048576
+    skipped: list[str] = []
+    parts = []
 
-async def upload_to_tg(file: DownloadedFile, message: Message, response: Message):
+    async with scratch.job(scratch.new_dir("_parts")) as job:
+        if file.type in {MediaType.VIDEO, MediaType.GIF} and "-d" not in message.flags:
+            await response.edit(f"Splitting <code>{file.name}</code> at keyframes...")
+            try:
+                # Video parts are copies, byte parts are read from the original in place.
+                await job.reserve(int(file.size * 1048576), response)
+                parts = [
+                    DownloadedFile(file=part)
+                    for part in await split_video(file.path, part_size, str(job.path))
+                ]
+            except Exception as e:
+                # Odd containers can't always be cut, fall back to plain byte ranges.
+                skipped.append(f"Keyframe split failed, sent as byte parts: {e}")
+                shutil.rmtree(job.path, ignore_errors=True)
+                parts = []
 
-    progress_args = (response, "Uploading...", file.path)
+        if not parts:
+            parts = split_file(file.path, part_size)
+
+        await response.edit(f"Uploading <code>{file.name}</code> in {len(parts)} parts...")
+
+        try:
+            done = await pool_upload(
+                message=message, response=response, files=parts, skipped=skipped
+            )
+        except asyncio.exceptions.CancelledError:
+            await response.edit("Cancelled....")
+            raise
+
+    if done == len(parts):
+        await response.delete()
+        return
+
+    await response.edit(
+        f"Uploaded {done}/{len(parts)} parts.\n\n<b>Errors</b>:\n" + "\n".join(skipped)
+    )
+
+
+async def get_upload_method(
+    file: DownloadedFile | SplitPart, message: Message
+) -> UPLOAD_TYPES:
+    if isinstance(file, SplitPart):
+        # A fresh range view per call, retries after a FloodWait start from a closed one.
+        async def send_part(**kwargs) -> PyroMessage:
+            with file.open() as document:
+                return await message._client.send_document(
+                    document=document, file_name=file.name, **kwargs
+                )
+
+        return send_part
 
     if "-d" in message.flags:
-        upload_method = partial(
+        return partial(
             message._client.send_document, document=file.path, disable_content_type_detection=True
         )
-    else:
-        upload_method: UPLOAD_TYPES = await FILE_TYPE_MAP[file.type](
-            bot=message._client, file=file, has_spoiler="-s" in message.flags
-        )
+    return await FILE_TYPE_MAP[file.type](
+        bot=message._client, file=file, has_spoiler="-s" in message.flags
+    )
+
+
+async def upload_to_tg(
+    file: DownloadedFile, message: Message, response: Message, use_cache: bool = True
+):
+    """
+    :param use_cache: Re-send a file_id of the same content if it was uploaded
+        before under the same name, False to always upload.
+    """
+    progress_args = (response, "Uploading...", file.path)
+    send_kwargs = dict(
+        chat_id=message.chat.id,
+        reply_parameters=ReplyParameters(message_id=message.reply_id),
+        caption=file.name,
+    )
+
+    async def upload() -> PyroMessage:
+        # Probes and thumbnails are only made when the bytes have to go up.
+        upload_method = await get_upload_method(file, message)
+        return await upload_method(progress=progress, progress_args=progress_args, **send_kwargs)
+
+    def send_file_id(file_id: str) -> Awaitable[PyroMessage]:
+        # Muted videos go up as animations, the file_id knows which one it is.
+        kind = FileId.decode(file_id).file_type.name.lower()
+        kwargs = {kind: file_id, **send_kwargs}
+        if kind in {"photo", "video", "animation"}:
+            kwargs["has_spoiler"] = "-s" in message.flags
+        if kind == "animation":
+            kwargs["unsave"] = True
+        return getattr(message._client, f"send_{kind}")(**kwargs)
 
     try:
-        await upload_method(
-            chat_id=message.chat.id,
-            reply_parameters=ReplyParameters(message_id=message.reply_id),
-            progress=progress,
-            progress_args=progress_args,
-            caption=file.name,
-        )
+        if use_cache:
+            kind = "document" if "-d" in message.flags else REGISTRY_KIND_MAP[file.type]
+            await file_ids.send(
+                key=await file_ids.file_key(kind, file.path),
+                send_file_id=send_file_id,
+                upload=upload,
+                name=file.name,
+            )
+        else:
+            await upload()
         await response.delete()
 
     except asyncio.exceptions.CancelledError:
         await response.edit("Cancelled....")
         raise
+
+
+async def url_stream_upload(url: str, message: Message, response: Message) -> bool:
+    """
+    Pipe a url straight into a telegram document while it downloads.
+    Only a few 512KiB parts are held in memory and nothing touches the disk.
+
+    :return: False if the url needs a regular download first: size unknown or over
+        the TG limit, or media that needs thumbnails and durations from the file.
+    """
+    # Shared session: no total timeout, so long streams only fail if the server stalls.
+    async with get_session().get(url) as http_response:
+        http_response.raise_for_status()
+
+        size = http_response.content_length
+        disposition = http_response.content_disposition
+        file_name = (disposition and disposition.filename) or unquote(
+            os.path.basename(urlparse(url).path)
+        )
+        mime_type = mimetypes.guess_type(file_name)[0] or http_response.content_type
+        is_media = mime_type.split("/")[0] in {"image", "video", "audio"}
+
+        if (
+            not size
+            or not file_name
+            or size_over_limit(size / 1048576, client=message._client)
+            or (is_media and "-d" not in message.flags)
+        ):
+            return False
+
+        await response.edit("URL detected in input, Streaming to TG....")
+        await stream_upload_to_tg(
+            client=message._client,
+            chunk_iter=http_response.content.iter_chunked(TG_PART_SIZE),
+            file_name=file_name,
+            file_size=size,
+            chat_id=message.chat.id,
+            reply_to_id=message.reply_id,
+            caption=file_name,
+            response=response,
+        )
+    return True
+
+
+async def stream_upload_to_tg(
+    client: BOT,
+    chunk_iter,
+    file_name: str,
+    file_size: int,
+    chat_id: int,
+    reply_to_id: int | None = None,
+    caption: str = "",
+    response: Message | None = None,
+    workers: int = 4,
+) -> PyroMessage:
+    """
+    :param chunk_iter: Async iterator of bytes, yielding exactly file_size bytes in order.
+    :param workers: Parts uploaded at once.
+    :return: The sent document message.
+
+    Re-cuts the stream into 512KiB parts and saves them with raw SaveFilePart calls,
+    so a file can be sent without ever being written to disk.
+    Only `workers` parts are held in memory at a time.
+    """
+    is_big = file_size > TG_BIG_FILE_SIZE
+    total_parts = max(-(-file_size // TG_PART_SIZE), 1)
+    file_id = client.rnd_id()
+    semaphore = asyncio.Semaphore(workers)
+    tasks: list[asyncio.Task] = []
+    uploaded = 0
+
+    async def save_part(index: int, data: bytes):
+        nonlocal uploaded
+        try:
+            if is_big:
+                query = raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id, file_part=index, file_total_parts=total_parts, bytes=data
+                )
+            else:
+                query = raw.functions.upload.SaveFilePart(
+                    file_id=file_id, file_part=index, bytes=data
+                )
+            if not await client.invoke(query):
+                raise Exception(f"Telegram rejected part {index} of {file_name}")
+
+            uploaded += len(data)
+            await progress(
+                current_size=uploaded,
+                total_size=file_size or 1,
+                response=response,
+                action_str="Uploading...",
+                file_path=file_name,
+            )
+        finally:
+            semaphore.release()
+
+    async def submit(data: bytes):
+        await semaphore.acquire()
+        for task in tasks:
+            if task.done() and task.exception():
+                semaphore.release()
+                raise task.exception()
+        tasks.append(asyncio.create_task(save_part(len(tasks), data)))
+
+    try:
+        pending = bytearray()
+        async for chunk in chunk_iter:
+            view = memoryview(chunk)
+
+            if pending:
+                needed = TG_PART_SIZE - len(pending)
+                pending += view[:needed]
+                view = view[needed:]
+                if len(pending) < TG_PART_SIZE:
+                    continue
+                await submit(bytes(pending))
+                pending = bytearray()
+
+            while len(view) >= TG_PART_SIZE:
+                await submit(view[:TG_PART_SIZE].tobytes())
+                view = view[TG_PART_SIZE:]
+
+            pending += view
+
+        if pending or not tasks:
+            await submit(bytes(pending))
+
+        await asyncio.gather(*tasks)
+
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    if is_big:
+        input_file = raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name)
+    else:
+        input_file = raw.types.InputFile(
+            id=file_id, parts=total_parts, name=file_name, md5_checksum=""
+        )
+
+    media = raw.types.InputMediaUploadedDocument(
+        file=input_file,
+        mime_type=mimetypes.guess_type(file_name)[0] or "application/octet-stream",
+        attributes=[raw.types.DocumentAttributeFilename(file_name=file_name)],
+        force_file=True,
+    )
+    result = await client.invoke(
+        raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=media,
+            message=caption,
+            random_id=client.rnd_id(),
+            reply_to=(
+                raw.types.InputReplyToMessage(reply_to_msg_id=reply_to_id) if reply_to_id else None
+            ),
+        )
+    )
+
+    users = {user.id: user for user in result.users}
+    chats = {chat.id: chat for chat in result.chats}
+    for update in result.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await PyroMessage._parse(client, update.message, users, chats)
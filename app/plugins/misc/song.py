@@ -2,14 +2,17 @@ import asyncio
 import json
 import shutil
 from pathlib import Path
-from time import time
 from urllib.parse import urlparse
 
 from pyrogram.enums import MessageEntityType
+from pyrogram.errors import BadRequest
 from pyrogram.types import InputMediaAudio
 from ub_core.utils import aio, run_shell_cmd
 
 from app import BOT, Message
+from app.plugins.files.probe import get_media_info
+from app.plugins.files.registry import file_ids
+from app.plugins.files.scratch import scratch
 
 domains = [
     "www.youtube.com",
@@ -50,35 +53,56 @@ async def song_dl(bot: BOT, message: Message) -> None | Message:
 
     response: Message = await message.reply("Searching....")
 
-    download_path: str = Path("downloads") / str(time())
+    # Links fetched before are sent by file_id, searches always need resolving.
+    query_key = file_ids.key("song", query) if query.startswith("http") else None
 
-    query_or_search: str = query if query.startswith("http") else f"ytsearch:{query}"
+    if query_key and (cached := await file_ids.get(query_key)):
+        try:
+            await response.edit_media(
+                InputMediaAudio(
+                    media=cached["file_id"], caption=f"<a href={query}>{cached["name"]}</a>"
+                )
+            )
+            return
+        except BadRequest:
+            await file_ids.forget(query_key)
 
-    song_info: dict = await get_download_info(query=query_or_search, path=download_path)
+    # yt-dlp only reports the size once it is done, nothing to reserve up front.
+    async with scratch.job() as job:
+        query_or_search: str = query if query.startswith("http") else f"ytsearch:{query}"
 
-    audio_files: list = list(download_path.glob("*mp3"))
+        song_info: dict = await get_download_info(query=query_or_search, path=job.path)
 
-    if not audio_files:
-        await response.edit("Song Not found.")
-        return
+        audio_files: list = list(job.path.glob("*mp3"))
 
-    audio_file = audio_files[0]
+        if not audio_files:
+            await response.edit("Song Not found.")
+            return
 
-    url = song_info.get("webpage_url")
+        audio_file = audio_files[0]
 
-    await response.edit(f"`Uploading {audio_file.name}....`")
+        url = song_info.get("webpage_url")
 
-    await response.edit_media(
-        InputMediaAudio(
-            media=str(audio_file),
-            caption=f"<a href={url}>{audio_file.name}</a>" if url else None,
-            duration=int(song_info.get("duration", 0)),
-            performer=song_info.get("channel", ""),
-            thumb=await aio.in_memory_dl(song_info.get("thumbnail")),
+        # yt-dlp leaves duration out for some extractors, read it off the file instead.
+        duration = (
+            int(song_info.get("duration") or 0) or (await get_media_info(audio_file)).duration
+        )
+
+        await response.edit(f"`Uploading {audio_file.name}....`")
+
+        sent = await response.edit_media(
+            InputMediaAudio(
+                media=str(audio_file),
+                caption=f"<a href={url}>{audio_file.name}</a>" if url else None,
+                duration=duration,
+                performer=song_info.get("channel", ""),
+                thumb=await aio.in_memory_dl(song_info.get("thumbnail")),
+            )
         )
-    )
 
-    shutil.rmtree(download_path, ignore_errors=True)
+        if sent and url:
+            for key in {query_key, file_ids.key("song", url)} - {None}:
+                await file_ids.remember(key, sent, name=audio_file.name)
 
 
 async def get_download_info(query: str, path: Path) -> dict:
@@ -1,25 +1,23 @@
-from urllib.parse import urlparse
+import re
 
 from app import BOT, Message
 
+# [https://]t.me/[c/]chat/[thread/]message, c/ marks a private chat's numeric id.
+MESSAGE_LINK_REGEX = re.compile(
+    r"^(?:https?://)?(?:www\.)?(?:t|telegram)\.me/(?:c/)?"
+    r"(?P<chat>[^/?#]+)/(?:(?P<thread>\d+)/)?(?P<message>\d+)/?(?:[?#].*)?$"
+)
 
-def parse_link(link: str) -> tuple[int | str, int, int]:
-    parsed_url: str = urlparse(link).path.strip("/")
-    link_chunks = parsed_url.lstrip("c/").split("/")
 
-    thread = "0"
-    if len(link_chunks) == 3:
-        chat, thread, message = link_chunks
-    else:
-        chat, message = link_chunks
+def parse_link(link: str) -> tuple[int | str, int, int]:
+    if not (match := MESSAGE_LINK_REGEX.match(link.strip())):
+        raise ValueError(f"Invalid message link: {link}")
 
+    chat = match.group("chat")
     if chat.isdigit():
         chat = int(f"-100{chat}")
 
-    if thread.isdigit():
-        thread = int(thread)
-
-    return chat, thread, int(message)
+    return chat, int(match.group("thread") or 0), int(match.group("message"))
 
 
 @BOT.add_cmd(cmd="gm")
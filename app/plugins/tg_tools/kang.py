@@ -1,8 +1,6 @@
 import asyncio
 import os
 import random
-import shutil
-import time
 from io import BytesIO
 from pathlib import Path
 
@@ -17,6 +15,9 @@ from pyrogram.utils import FileId
 from ub_core import utils as core_utils
 
 from app import BOT, Config, Message, bot, extra_config
+from app.plugins.files.probe import get_media_info
+from app.plugins.files.registry import file_ids
+from app.plugins.files.scratch import scratch
 
 EMOJIS = ("☕", "🤡", "🙂", "🤔", "🔪", "😂", "💀")
 
@@ -24,13 +25,15 @@ EMOJIS = ("☕", "🤡", "🙂", "🤔", "🔪", "😂", "💀")
 async def save_sticker(file: Path | BytesIO) -> str:
     client = getattr(bot, "bot", bot)
 
-    sent_file = await client.send_document(
-        chat_id=Config.LOG_CHAT, document=file, message_thread_id=Config.LOG_CHAT_THREAD_ID
-    )
-
-    if isinstance(file, Path) and file.is_file():
-        shutil.rmtree(file.parent, ignore_errors=True)
+    async def send(document: Path | BytesIO | str):
+        return await client.send_document(
+            chat_id=Config.LOG_CHAT, document=document, message_thread_id=Config.LOG_CHAT_THREAD_ID
+        )
 
+    # Kanging the same media again re-sends the known file_id instead of uploading.
+    sent_file = await file_ids.send(
+        key=await file_ids.file_key("sticker", file), send_file_id=send, upload=lambda: send(file)
+    )
     return sent_file.document.file_id
 
 
@@ -59,21 +62,24 @@ async def video_kang(message: Message, ff=False) -> tuple[str, None]:
     if video.file_size > 5242880:
         raise MemoryError("File Size exceeds 5MB.")
 
-    download_path = Path("downloads") / str(time.time())
-    input_file = download_path / "input.mp4"
-    output_file = download_path / "sticker.webm"
+    async with scratch.job() as job:
+        # The input plus a webm capped at 256k by resize_video.
+        await job.reserve(video.file_size + 262144)
+
+        input_file = job.path / "input.mp4"
+        output_file = job.path / "sticker.webm"
 
-    download_path.mkdir(parents=True, exist_ok=True)
+        job.path.mkdir(parents=True, exist_ok=True)
 
-    await message.download(str(input_file))
+        await message.download(str(input_file))
 
-    duration = getattr(video, "duration", None)
-    if not duration:
-        duration = await core_utils.get_duration(file=str(input_file))
+        duration = getattr(video, "duration", None)
+        if not duration:
+            duration = (await get_media_info(str(input_file))).duration
 
-    await resize_video(input_file=input_file, output_file=output_file, duration=duration, ff=ff)
+        await resize_video(input_file=input_file, output_file=output_file, duration=duration, ff=ff)
 
-    return await save_sticker(output_file), None
+        return await save_sticker(output_file), None
 
 
 async def resize_video(
@@ -1,8 +1,6 @@
 import asyncio
 import os
 import random
-import shutil
-import time
 from io import BytesIO
 
 from PIL import Image
@@ -12,6 +10,8 @@ from pyrogram.errors import StickersetInvalid
 from ub_core import utils as core_utils
 
 from app import BOT, Message, bot, extra_config
+from app.plugins.files.probe import get_media_info
+from app.plugins.files.scratch import ScratchJob, scratch
 
 EMOJIS = ("☕", "🤡", "🙂", "🤔", "🔪", "😂", "💀")
 
@@ -46,16 +46,16 @@ async def get_sticker_set(limit: int, is_video=False) -> tuple[str, str, bool]:
     return pack_title, f"{pack_name}{video}_{count}", create_new
 
 
-async def photo_kang(message: Message, **_) -> dict:
-    download_path = os.path.join("downloads", str(time.time()))
-    os.makedirs(download_path, exist_ok=True)
+async def photo_kang(message: Message, job: ScratchJob, **_) -> dict:
+    await job.reserve(core_utils.get_tg_media_details(message).file_size)
+    os.makedirs(job.path, exist_ok=True)
 
-    input_file = os.path.join(download_path, "photo.jpg")
+    input_file = os.path.join(job.path, "photo.jpg")
     await message.download(input_file)
 
     file = await asyncio.to_thread(resize_photo, input_file)
 
-    return dict(cmd="/newpack", limit=120, is_video=False, file=file, path=download_path)
+    return dict(cmd="/newpack", limit=120, is_video=False, file=file)
 
 
 def resize_photo(input_file: str) -> BytesIO:
@@ -70,25 +70,26 @@ def resize_photo(input_file: str) -> BytesIO:
     return resized_photo
 
 
-async def video_kang(message: Message, ff=False) -> dict:
+async def video_kang(message: Message, job: ScratchJob, ff=False) -> dict:
     video = message.video or message.animation or message.document
     if video.file_size > 5242880:
         raise MemoryError("File Size exceeds 5MB.")
 
-    download_path = os.path.join("downloads", f"{time.time()}")
-    os.makedirs(download_path, exist_ok=True)
+    # The input plus a webm capped at 256k by resize_video.
+    await job.reserve(video.file_size + 262144)
+    os.makedirs(job.path, exist_ok=True)
 
-    input_file = os.path.join(download_path, "input.mp4")
-    output_file = os.path.join(download_path, "sticker.webm")
+    input_file = os.path.join(job.path, "input.mp4")
+    output_file = os.path.join(job.path, "sticker.webm")
 
     await message.download(input_file)
 
     if not hasattr(video, "duration"):
-        duration = await core_utils.get_duration(file=input_file)
+        duration = (await get_media_info(input_file)).duration
     else:
         duration = video.duration
     await resize_video(input_file=input_file, output_file=output_file, duration=duration, ff=ff)
-    return dict(cmd="/newvideo", limit=50, is_video=True, file=output_file, path=download_path)
+    return dict(cmd="/newvideo", limit=50, is_video=True, file=output_file)
 
 
 async def resize_video(input_file: str, output_file: str, duration: int, ff: bool = False):
@@ -105,12 +106,12 @@ async def resize_video(input_file: str, output_file: str, duration: int, ff: boo
     await core_utils.run_shell_cmd(cmd=f"{cmd}'{output_file}'")
 
 
-async def document_kang(message: Message, ff: bool = False) -> dict:
+async def document_kang(message: Message, job: ScratchJob, ff: bool = False) -> dict:
     name, ext = os.path.splitext(message.document.file_name)
     if ext.lower() in core_utils.MediaExts.PHOTO:
-        return await photo_kang(message)
+        return await photo_kang(message, job=job)
     elif ext.lower() in {*core_utils.MediaExts.VIDEO, *core_utils.MediaExts.GIF}:
-        return await video_kang(message=message, ff=ff)
+        return await video_kang(message=message, job=job, ff=ff)
 
 
 async def sticker_kang(message: Message, **_) -> dict:
@@ -155,9 +156,6 @@ async def create_n_kang(kwargs: dict, pack_title: str, pack_name: str, message:
         await convo.send_message("/skip")
         await convo.send_message(pack_name, get_response=True)
 
-    if kwargs.get("path"):
-        shutil.rmtree(kwargs["path"], ignore_errors=True)
-
 
 async def kang_sticker(bot: BOT, message: Message):
     """
@@ -176,36 +174,34 @@ async def kang_sticker(bot: BOT, message: Message):
 
     response: Message = await message.reply("<code>Processing...</code>")
 
-    kwargs: dict = await media_func(message=replied, ff="-f" in message.flags)
-
-    pack_title, pack_name, create_new = await get_sticker_set(
-        limit=kwargs["limit"], is_video=kwargs["is_video"]
-    )
+    async with scratch.job() as job:
+        kwargs: dict = await media_func(message=replied, job=job, ff="-f" in message.flags)
 
-    if create_new:
-        await create_n_kang(
-            kwargs=kwargs, pack_title=pack_title, pack_name=pack_name, message=message
+        pack_title, pack_name, create_new = await get_sticker_set(
+            limit=kwargs["limit"], is_video=kwargs["is_video"]
         )
-        await response.edit(text=f"Kanged: <a href='t.me/addstickers/{pack_name}'>here</a>")
-        return
 
-    async with bot.Convo(client=bot, chat_id="stickers", timeout=5) as convo:
-        await convo.send_message(text="/addsticker", get_response=True)
-        await convo.send_message(text=pack_name, get_response=True)
+        if create_new:
+            await create_n_kang(
+                kwargs=kwargs, pack_title=pack_title, pack_name=pack_name, message=message
+            )
+            await response.edit(text=f"Kanged: <a href='t.me/addstickers/{pack_name}'>here</a>")
+            return
 
-        if kwargs.get("sticker"):
-            await replied.copy(chat_id="stickers", caption="")
-            await convo.get_response()
-        else:
-            await convo.send_document(document=kwargs["file"], get_response=True)
+        async with bot.Convo(client=bot, chat_id="stickers", timeout=5) as convo:
+            await convo.send_message(text="/addsticker", get_response=True)
+            await convo.send_message(text=pack_name, get_response=True)
 
-        await convo.send_message(
-            text=kwargs.get("emoji") or random.choice(EMOJIS), get_response=True
-        )
-        await convo.send_message(text="/done", get_response=True)
+            if kwargs.get("sticker"):
+                await replied.copy(chat_id="stickers", caption="")
+                await convo.get_response()
+            else:
+                await convo.send_document(document=kwargs["file"], get_response=True)
 
-    if kwargs.get("path"):
-        shutil.rmtree(kwargs["path"], ignore_errors=True)
+            await convo.send_message(
+                text=kwargs.get("emoji") or random.choice(EMOJIS), get_response=True
+            )
+            await convo.send_message(text="/done", get_response=True)
 
     await response.edit(
         text=f"Kanged: <a href='t.me/addstickers/{pack_name}'>here</a>", disable_preview=True
@@ -0,0 +1,127 @@
+"""
+Bytes copied per GB uploaded while packing downloaded chunks into Drive PUT units.
+
+Replays a random stream of network sized chunks through the old url pipeline loop
+(buffer += chunk, then re-slicing the buffer) and through ChunkRing, and counts
+the bytes each one copies. Both outputs must match the input byte for byte.
+
+Needs the bot's environment (config.env, DB), run from the repo root:
+    python scripts/bench_chunk_assembly.py [size_mb]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from app.plugins.files.gdrive import Drive  # noqa: E402
+from app.plugins.files.gdrive.utils import ChunkRing  # noqa: E402
+
+# Average chunk sizes handed out by aiohttp's iter_chunks on slow and fast links.
+AVERAGE_CHUNKS = (16384, 65536, 524288)
+# The unit the old loop packed url uploads into.
+OLD_UNIT = 2 * Drive.UPLOAD_UNIT
+
+
+def chunk_sizes(total: int, average: int) -> list[int]:
+    rnd = random.Random(average)
+    sizes = []
+    while total:
+        size = min(total, rnd.randint(1, 2 * average))
+        sizes.append(size)
+        total -= size
+    return sizes
+
+
+def split(data: bytes, sizes: list[int]) -> list[bytes]:
+    chunks = []
+    position = 0
+    for size in sizes:
+        chunks.append(data[position : position + size])
+        position += size
+    return chunks
+
+
+def concat_assembly(chunks: list[bytes], unit: int) -> tuple[bytes, int]:
+    """The loop ChunkRing replaced, every bytes object it builds is a copy."""
+    output = []
+    copied = 0
+    buffer = b""
+
+    for chunk in chunks:
+        buffer += chunk
+        copied += len(buffer)
+        if len(buffer) < unit:
+            continue
+        output.append(buffer[:unit])
+        buffer = buffer[unit:]
+        copied += len(output[-1]) + len(buffer)
+
+    if buffer:
+        output.append(buffer)
+    return b"".join(output), copied
+
+
+async def ring_assembly(chunks: list[bytes], unit: int) -> tuple[bytes, int]:
+    """ChunkRing copies each byte once, into the buffer that is PUT."""
+
+    async def iter_chunks():
+        for chunk in chunks:
+            yield chunk
+
+    ring = ChunkRing(depth=Drive.PIPELINE_DEPTH, unit_size=unit)
+    store = {"downloaded_size": 0}
+    fill_task = asyncio.create_task(ring.fill(iter_chunks(), store))
+
+    output = bytearray()
+    copied = 0
+    while (view := await ring.filled.get()) is not None:
+        if isinstance(view, Exception):
+            raise view
+        copied += len(view)
+        output += view
+        ring.release(view)
+
+    await fill_task
+    return bytes(output), copied
+
+
+def check(name: str, ok: bool, detail: str = "") -> bool:
+    status = "ok  " if ok else "FAIL"
+    print(f"{status} {name}: {detail}" if detail else f"{status} {name}")
+    return ok
+
+
+async def main(size_mb: int) -> bool:
+    data = os.urandom(size_mb * 1048576)
+    per_gb = 1073741824 / len(data)
+    results = []
+
+    for average in AVERAGE_CHUNKS:
+        chunks = split(data, chunk_sizes(len(data), average))
+
+        started = time.perf_counter()
+        old_output, old_copied = concat_assembly(chunks, OLD_UNIT)
+        old_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        new_output, new_copied = await ring_assembly(chunks, Drive.PUT_SIZE)
+        new_time = time.perf_counter() - started
+
+        results.append(
+            check(
+                f"avg chunk {average // 1024} KiB",
+                old_output == data and new_output == data and new_copied < old_copied,
+                f"before {old_copied * per_gb / 1073741824:.2f} GB copied/GB in {old_time:.2f}s,"
+                f" after {new_copied * per_gb / 1073741824:.2f} GB copied/GB in {new_time:.2f}s",
+            )
+        )
+
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)) else 1)
@@ -0,0 +1,186 @@
+"""
+Throughput of Telegram to Drive uploads against a fake MTProto stream and a local
+Drive stand-in.
+
+stream_media hands out 1MiB chunks, each after a GetFile round trip. The stand-in
+serves resumable upload sessions with a fixed overhead per PUT and a capped rate.
+The old path awaited every chunk and then PUT it before fetching the next one;
+the pipeline prefetches into spare buffers and coalesces chunks into PUT_SIZE
+units. Both uploads must reach the stand-in byte for byte.
+
+Needs the bot's environment (config.env, DB), run from the repo root:
+    python scripts/bench_telegram_to_drive.py [size_mb]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+from aiohttp import ClientSession, web
+from google.oauth2.credentials import Credentials
+
+sys.path.insert(0, os.getcwd())
+
+from app.plugins.files.gdrive import Drive  # noqa: E402
+from app.plugins.files.gdrive.utils import ChunkRing  # noqa: E402
+
+TG_CHUNK = 1048576
+# Per GetFile round trip and bytes/s.
+TG_RTT = 0.030
+TG_RATE = 40e6
+# Per resumable PUT and bytes/s.
+PUT_OVERHEAD = 0.120
+DRIVE_RATE = 60e6
+
+
+class FakeTelegram:
+    """stream_media stand-in, offsets are counted in 1MiB chunks like pyrogram's."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def stream_media(self, message, offset: int = 0):
+        for position in range(offset * TG_CHUNK, len(self.data), TG_CHUNK):
+            await asyncio.sleep(TG_RTT + TG_CHUNK / TG_RATE)
+            yield self.data[position : position + TG_CHUNK]
+
+
+class FakeMediaMessage:
+    def __init__(self, client: FakeTelegram):
+        self._client = client
+
+
+class DriveStandIn:
+    """Resumable upload sessions that keep what they receive, PUT_OVERHEAD per PUT."""
+
+    def __init__(self):
+        self.runner: web.AppRunner | None = None
+        self.url = ""
+        self.received = bytearray()
+        self.puts = 0
+
+    async def create(self, request: web.Request) -> web.Response:
+        self.received = bytearray()
+        self.puts = 0
+        return web.Response(headers={"Location": f"{self.url}/upload/session"})
+
+    async def put(self, request: web.Request) -> web.Response:
+        self.puts += 1
+        await asyncio.sleep(PUT_OVERHEAD)
+
+        content_range = request.headers["Content-Range"].removeprefix("bytes ")
+        span, total = content_range.split("/")
+        start, _ = span.split("-")
+        if int(start) != len(self.received):
+            return web.Response(status=400, text=f"expected offset {len(self.received)}")
+
+        async for data in request.content.iter_chunked(65536):
+            self.received += data
+            await asyncio.sleep(len(data) / DRIVE_RATE)
+
+        if total != "*" and len(self.received) == int(total):
+            return web.json_response({"id": "bench"})
+        return web.Response(status=308, headers={"Range": f"bytes=0-{len(self.received) - 1}"})
+
+    async def start(self):
+        app = web.Application(client_max_size=Drive.MAX_PUT_SIZE + 1048576)
+        app.router.add_post("/upload/drive/v3/files", self.create)
+        app.router.add_put("/upload/session", self.put)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", 0).start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def new_job(drive: Drive, size: int) -> dict:
+    return {
+        "key": "bench",
+        "location": await drive.create_file("bench.bin"),
+        "size": size,
+        # Never parked for .gresume if a PUT fails.
+        "source": {"type": "archive"},
+    }
+
+
+async def serial_upload(drive: Drive, message: FakeMediaMessage, size: int) -> str | None:
+    """The loop the pipeline replaced: fetch a chunk, PUT it, repeat."""
+    job = await new_job(drive, size)
+    start = 0
+    file_id = None
+    async for chunk in drive._iter_telegram(message, 0):
+        file_id = await drive._put_chunk(job, start, chunk)
+        start += len(chunk)
+    return file_id
+
+
+async def pipelined_upload(drive: Drive, message: FakeMediaMessage, size: int) -> str | None:
+    """_pipe_to_drive without the dedupe and md5 bookkeeping."""
+    job = await new_job(drive, size)
+    store = {"downloaded_size": 0, "uploaded_size": 0}
+    ring = ChunkRing(
+        depth=drive.PIPELINE_DEPTH, unit_size=drive._put_size(size, drive.MAX_PUT_SIZE)
+    )
+    ring.target_size = drive._put_size(size, drive.PUT_SIZE)
+
+    fill_task = asyncio.create_task(ring.fill(drive._iter_telegram(message, 0), store))
+    try:
+        return await drive._drain_chunks(job, ring, store)
+    finally:
+        fill_task.cancel()
+
+
+def check(name: str, ok: bool, detail: str = "") -> bool:
+    status = "ok  " if ok else "FAIL"
+    print(f"{status} {name}: {detail}" if detail else f"{status} {name}")
+    return ok
+
+
+async def main(size_mb: int) -> bool:
+    data = os.urandom(size_mb * 1048576)
+    message = FakeMediaMessage(FakeTelegram(data))
+    stand_in = DriveStandIn()
+    await stand_in.start()
+
+    drive = Drive()
+    drive.UPLOAD_URL = f"{stand_in.url}/upload/drive/v3"
+    drive.tokens.set_creds(Credentials(token="bench"))
+    results = []
+    rates = {}
+
+    try:
+        async with ClientSession() as session:
+            drive._aiohttp_session = session
+
+            for name, upload in (("serial", serial_upload), ("pipelined", pipelined_upload)):
+                started = time.perf_counter()
+                file_id = await upload(drive, message, len(data))
+                seconds = time.perf_counter() - started
+                rates[name] = size_mb / seconds
+                results.append(
+                    check(
+                        name,
+                        file_id == "bench" and stand_in.received == data,
+                        f"{rates[name]:.1f} MiB/s, {seconds:.1f}s, {stand_in.puts} PUTs",
+                    )
+                )
+    finally:
+        await stand_in.stop()
+
+    ceiling = TG_CHUNK / (TG_RTT + TG_CHUNK / TG_RATE) / 1048576
+    results.append(
+        check(
+            "pipelined is faster",
+            rates["pipelined"] > rates["serial"],
+            f"Telegram alone caps this at {ceiling:.1f} MiB/s",
+        )
+    )
+    return all(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 256)) else 1)
@@ -0,0 +1,201 @@
+"""
+Checks segmented url downloads against a local Range server.
+
+Every connection to the server is capped in speed like a real host, so
+ranged_download with DOWNLOAD_CONNECTIONS connections should beat a single one.
+Then one connection is slowed down further and another dropped midway, and
+the file is fetched again, resumed from a partial, and streamed by iter_ranges.
+Every result must match the served bytes.
+
+Needs the bot's environment (config.env, DB), run from the repo root:
+    python scripts/check_ranged_download.py [size_mb]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, os.getcwd())
+
+from app import extra_config  # noqa: E402
+from app.plugins.files.download import iter_ranges, probe_url, ranged_download  # noqa: E402
+
+WRITE_SIZE = 65536
+# About 32 mb/s per connection.
+WRITE_DELAY = 0.002
+
+
+class RangeServer:
+    """
+    Serves data with Range support, WRITE_DELAY after every write.
+    With faults on, the 2nd request is 10x slower and the 3rd drops after 1MiB.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.faults = False
+        self.requests = 0
+        self.dropped = False
+        self.runner: web.AppRunner | None = None
+        self.url = ""
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        size = len(self.data)
+        if not (range_header := request.headers.get("Range")):
+            return web.Response(body=self.data, headers={"Accept-Ranges": "bytes"})
+
+        start, end = range_header.removeprefix("bytes=").split("-")
+        start, end = int(start), min(int(end or size - 1), size - 1)
+
+        self.requests += 1
+        request_number = self.requests
+        response = web.StreamResponse(
+            status=206,
+            headers={
+                "Accept-Ranges": "bytes",
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1),
+                "Content-Disposition": 'attachment; filename="check.bin"',
+                "ETag": '"check"',
+            },
+        )
+        await response.prepare(request)
+
+        position = start
+        try:
+            while position <= end:
+                next_position = min(position + WRITE_SIZE, end + 1)
+                await response.write(self.data[position:next_position])
+                position = next_position
+
+                slow = self.faults and request_number == 2
+                await asyncio.sleep(WRITE_DELAY * (10 if slow else 1))
+
+                if (
+                    self.faults
+                    and request_number == 3
+                    and not self.dropped
+                    and position - start > 1048576
+                ):
+                    self.dropped = True
+                    request.transport.close()
+                    return response
+        except ConnectionError:
+            pass
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/file", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", 0).start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}/file"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def reset(self):
+        self.requests = 0
+        self.dropped = False
+
+
+async def timed_download(
+    server: RangeServer, session: ClientSession, path: Path, connections: int, **kwargs
+) -> float:
+    server.reset()
+    started = time.perf_counter()
+    await ranged_download(
+        url=server.url,
+        file_path=path,
+        size=len(server.data),
+        session=session,
+        connections=connections,
+        **kwargs,
+    )
+    return time.perf_counter() - started
+
+
+def check(name: str, ok: bool, detail: str = "") -> bool:
+    status = "ok  " if ok else "FAIL"
+    print(f"{status} {name}: {detail}" if detail else f"{status} {name}")
+    return ok
+
+
+async def run_checks(server: RangeServer, session: ClientSession, tmp: str) -> list[bool]:
+    data = server.data
+    connections = max(extra_config.DOWNLOAD_CONNECTIONS, 2)
+    results = []
+
+    info = await probe_url(server.url, session=session)
+    results.append(
+        check(
+            "probe",
+            info.is_segmentable and info.size == len(data),
+            f"{info.size} bytes, validator {info.validator}",
+        )
+    )
+
+    single = Path(tmp, "single.bin")
+    single_time = await timed_download(server, session, single, connections=1)
+    results.append(check("1 connection", single.read_bytes() == data))
+
+    multi = Path(tmp, "multi.bin")
+    multi_time = await timed_download(server, session, multi, connections=connections)
+    results.append(
+        check(
+            f"{connections} connections",
+            multi.read_bytes() == data and multi_time < single_time,
+            f"{multi_time:.2f}s vs {single_time:.2f}s for 1 connection",
+        )
+    )
+
+    server.faults = True
+    faulty = Path(tmp, "faulty.bin")
+    faulty_time = await timed_download(server, session, faulty, connections=connections)
+    results.append(
+        check(
+            "slow and dropped connections",
+            faulty.read_bytes() == data and server.dropped,
+            f"{faulty_time:.2f}s, {server.requests} requests",
+        )
+    )
+
+    # Resume: the first and last quarter are already on disk.
+    resumed = Path(tmp, "resumed.bin")
+    quarter = len(data) // 4
+    resumed.write_bytes(data[:quarter] + bytes(len(data) - 2 * quarter) + data[-quarter:])
+    missing = [[quarter, len(data) - quarter - 1]]
+    await timed_download(server, session, resumed, connections=connections, resume=missing)
+    results.append(check("resume", resumed.read_bytes() == data))
+
+    server.reset()
+    streamed = bytearray()
+    async for block in iter_ranges(
+        url=server.url, size=len(data), session=session, connections=connections
+    ):
+        streamed += block
+    results.append(check("iter_ranges", streamed == data and server.dropped))
+
+    return results
+
+
+async def main(size_mb: int) -> bool:
+    server = RangeServer(os.urandom(size_mb * 1048576))
+    await server.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            async with ClientSession() as session:
+                return all(await run_checks(server, session, tmp))
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 64)) else 1)